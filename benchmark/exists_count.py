@@ -0,0 +1,89 @@
+"""
+benchmark of existence checks and counts on collection of DOCS_COUNT documents,
+count_documents() > 0 vs document_exists() and count_documents({}) vs estimated_count(),
+run `python -m benchmark.exists_count [docs_count]` from project root (env as for api is needed),
+documents are stored in separate BENCHMARK_DB_NAME database which is reused by next runs
+"""
+import asyncio
+import sys
+import time
+from typing import Awaitable, Callable
+
+import pymongo
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+from gold_calf.core import settings
+from gold_calf.db.base import BaseCollection, BaseFields
+
+BENCHMARK_DB_NAME = "gold_calf_benchmark"
+DOCS_COUNT = 10 ** 6
+INSERT_CHUNK_SIZE = 10000
+REPEAT = 20
+GROUPS_COUNT = 10
+
+
+class BenchmarkFields(BaseFields):
+    group = "group"  # indexed, GROUPS_COUNT distinct values
+    payload = "payload"  # not indexed
+
+
+class BenchmarkCollection(BaseCollection):
+    COLLECTION_NAME = "exists_count"
+
+    async def ensure_indexes(self):
+        await super().ensure_indexes()
+        await self.motor_collection.create_index([(BenchmarkFields.group, pymongo.ASCENDING)])
+
+
+async def fill(collection: BenchmarkCollection, docs_count: int):
+    if await collection.estimated_count() == docs_count:
+        return
+    await collection.drop_collection()
+    await collection.ensure_indexes()
+    # plain insert_many, int_ids are known and seq is not needed here
+    for start in range(0, docs_count, INSERT_CHUNK_SIZE):
+        await collection.motor_collection.insert_many([
+            {
+                BenchmarkFields.int_id: i + 1,
+                BenchmarkFields.group: i % GROUPS_COUNT,
+                BenchmarkFields.payload: i
+            }
+            for i in range(start, min(start + INSERT_CHUNK_SIZE, docs_count))
+        ])
+    print(f"{docs_count} documents were inserted")
+
+
+async def bench(name: str, func: Callable[[], Awaitable]):
+    """prints best ms of REPEAT calls"""
+    best = None
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        await func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name}: {best * 1000:.2f}ms")
+
+
+async def main(docs_count: int):
+    motor_db = AsyncIOMotorClient(settings.mongo_uri).get_database(BENCHMARK_DB_NAME)
+    pymongo_db = MongoClient(settings.mongo_uri).get_database(BENCHMARK_DB_NAME)
+    collection = BenchmarkCollection(motor_db=motor_db, pymongo_db=pymongo_db)
+    await fill(collection, docs_count)
+
+    for name, filter_ in [
+        ("indexed field, many matches", {BenchmarkFields.group: 1}),
+        ("not indexed field, many matches", {BenchmarkFields.payload: {"$gte": 0}}),
+        ("int_id, one match", {BenchmarkFields.int_id: docs_count // 2})
+    ]:
+        print(name)
+        await bench("  count_documents() > 0", lambda: collection.count_documents(filter_))
+        await bench("  document_exists()", lambda: collection.document_exists(filter_))
+
+    print("whole collection")
+    await bench("  count_documents({})", lambda: collection.count_documents())
+    await bench("  estimated_count()", lambda: collection.estimated_count())
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DOCS_COUNT))
@@ -0,0 +1,64 @@
+"""
+microbenchmark of BaseDBM.parse_document, trusted (construct) path vs validating path,
+run `python -m benchmark.parse_document` from project root
+"""
+import timeit
+from datetime import datetime
+
+from bson import ObjectId
+
+from gold_calf.models import User, Request
+
+DOCS_COUNT = 10000
+REPEAT = 5
+
+
+def make_user_document(i: int) -> dict:
+    return {
+        "_id": ObjectId(),
+        "int_id": i,
+        "created": datetime.utcnow(),
+        "roles": ["worker"],
+        "is_accepted": False,
+        "mail": f"user{i}@example.com"
+    }
+
+
+def make_request_document(i: int) -> dict:
+    return {
+        "_id": ObjectId(),
+        "int_id": i,
+        "created": datetime.utcnow(),
+        "mail": f"user{i}@example.com",
+        "salary": 100000 + i,
+        "remote_radio": "100",
+        "work_year": 2023,
+        "experience_level": "SE",
+        "employment_type": "FT",
+        "job_title": "Data Scientist",
+        "is_accepted": False,
+        "user_id": i
+    }
+
+
+def bench(model, docs: list[dict], validate: bool) -> float:
+    """best seconds per document"""
+    seconds = min(timeit.repeat(
+        lambda: [model.parse_document(doc, validate=validate) for doc in docs], number=1, repeat=REPEAT
+    ))
+    return seconds / len(docs)
+
+
+def main():
+    for model, make_document in [(User, make_user_document), (Request, make_request_document)]:
+        docs = [make_document(i) for i in range(DOCS_COUNT)]
+        validated = bench(model, docs, validate=True)
+        trusted = bench(model, docs, validate=False)
+        print(
+            f"{model.__name__}: validated {validated * 1e6:.2f}us/doc, "
+            f"trusted {trusted * 1e6:.2f}us/doc, x{validated / trusted:.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@ from datetime import datetime
 from typing import Optional, Any
 
 from bson import ObjectId
-from pydantic import BaseModel, Extra
+from pydantic import BaseModel, Extra, Field
 
 
 class BaseSchema(BaseModel):
@@ -57,8 +57,12 @@ class RequestOut(BaseOutDBMSchema):
     is_accepted: bool
     user_id: int
 
+class ClaimedRequestOut(RequestOut):
+    claimed_by: int
+    claim_expires_at: datetime
+
 class SensitiveUserOut(UserOut):
-    tokens: list[str]
+    tokens: list[str] = []
     current_token: str
 
 
@@ -115,4 +119,18 @@ class RequestExistsStatusOut(BaseSchemaOut):
 
 class RequestAcceptIn(BaseSchemaIn):
     request_id: int
-    is_accepted: bool
\ No newline at end of file
+    is_accepted: bool
+
+
+class ProcessRequestsIn(BaseSchemaIn):
+    items: list[RequestAcceptIn] = Field(..., min_items=1, max_items=1000)
+
+
+class ProcessRequestResultOut(BaseSchemaOut):
+    request_id: int
+    is_accepted: bool
+    result: str  # one of ProcessRequestResults
+
+
+class ProcessRequestsOut(BaseSchemaOut):
+    items: list[ProcessRequestResultOut]
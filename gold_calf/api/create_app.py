@@ -5,8 +5,9 @@ from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 
 from gold_calf.api.events import on_startup, on_shutdown
+from gold_calf.api.metrics import MetricsMiddleware
 from gold_calf.api.v1 import api_v1_router
-from gold_calf.consts import UserRoles
+from gold_calf.consts import UserRoles, NEXT_CURSOR_HEADER
 from gold_calf.core import settings
 from gold_calf.log import setup_logging
 
@@ -31,7 +32,9 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=['*'],
         allow_headers=['*'],
+        expose_headers=[NEXT_CURSOR_HEADER],
     )
+    app.add_middleware(MetricsMiddleware)
 
     app.include_router(api_v1_router, prefix=settings.api_prefix)
 
@@ -5,12 +5,17 @@ from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from starlette import status
 
 from gold_calf.consts import RolesType
+from gold_calf.core import settings
 from gold_calf.models import User
-from gold_calf.services import get_user
+from gold_calf.services import get_user_by_token, get_user_by_signed_token, get_user
+from gold_calf.signed_token import is_signed_token
 
 
 async def get_current_user(*, ac: HTTPAuthorizationCredentials = Security(HTTPBearer())) -> Optional[User]:
-    user = await get_user(token=ac.credentials)
+    if settings.signed_tokens is True and is_signed_token(ac.credentials):
+        user = get_user_by_signed_token(token=ac.credentials)
+    else:
+        user = await get_user_by_token(token=ac.credentials)
     if user is None:
         return None
     user.misc_data['current_token'] = ac.credentials
@@ -25,6 +30,17 @@ async def get_strict_current_user(user: User = Depends(get_current_user)) -> Use
     return user
 
 
+async def get_strict_current_full_user(user: User = Depends(get_strict_current_user)) -> User:
+    """current user with all db fields, user from signed token claims is loaded from db"""
+    if user.misc_data.get("from_claims") is not True:
+        return user
+    full_user = await get_user(id_=user.oid)
+    if full_user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="no user")
+    full_user.misc_data['current_token'] = user.misc_data['current_token']
+    return full_user
+
+
 def make_strict_depends_on_roles(roles: RolesType):
     def wrapper(current_user: User = Depends(get_strict_current_user)) -> User:
         if not current_user.compare_roles(roles):
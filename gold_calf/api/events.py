@@ -1,11 +1,16 @@
+import asyncio
 import logging
 
+from gold_calf.api.metrics import write_snapshot, remove_snapshot
 from gold_calf.consts import UserRoles, Modes
-from gold_calf.core import db, settings
+from gold_calf.core import db, settings, mail_outbox
 from gold_calf.db.db import CannotConnectToDb
+from gold_calf.services import refresh_revocations
 
 log = logging.getLogger(__name__)
 
+_background_tasks: list[asyncio.Task] = []
+
 
 async def prepare_db():
     try:
@@ -17,9 +22,50 @@ async def prepare_db():
     log.info("db conn is good")
 
 
+async def refresh_revocations_periodically():
+    while True:
+        await asyncio.sleep(settings.revocations_refresh_interval)
+        try:
+            await refresh_revocations()
+        except Exception as e:
+            log.exception(e)
+
+
+async def refresh_mail_queue_depth_periodically():
+    while True:
+        try:
+            await mail_outbox.refresh_queue_depth()
+        except Exception as e:
+            log.exception(e)
+        await asyncio.sleep(settings.mail_queue_depth_refresh_interval)
+
+
+async def write_metrics_periodically():
+    while True:
+        try:
+            write_snapshot(settings.metrics_dirpath)
+        except Exception as e:
+            log.exception(e)
+        await asyncio.sleep(settings.metrics_write_interval)
+
+
 async def on_startup(*args, **kwargs):
     await prepare_db()
+    await mail_outbox.start()
+    _background_tasks.append(asyncio.create_task(refresh_mail_queue_depth_periodically()))
+    if settings.signed_tokens is True:
+        if settings.signed_tokens_secret is None:
+            raise ValueError("settings.signed_tokens is True but settings.signed_tokens_secret is None")
+        await refresh_revocations()
+        _background_tasks.append(asyncio.create_task(refresh_revocations_periodically()))
+    if settings.metrics_dirpath is not None:
+        _background_tasks.append(asyncio.create_task(write_metrics_periodically()))
 
 
 async def on_shutdown(*args, **kwargs):
-    pass
\ No newline at end of file
+    await mail_outbox.stop()
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    if settings.metrics_dirpath is not None:
+        remove_snapshot(settings.metrics_dirpath)
@@ -0,0 +1,66 @@
+"""
+raw mongo document -> json bytes for out schemas without building pydantic models,
+json matches what fastapi would return for response_model (same keys in same order, iso datetimes)
+"""
+from typing import Any, Iterable
+
+import orjson
+from bson import ObjectId
+from starlette.responses import JSONResponse
+
+from gold_calf.api.chema import BaseSchemaOut, UserOut, RequestOut
+from gold_calf.db.base import Document, BaseFields
+from gold_calf.models import BaseDBM, User, Request
+
+
+def encode_default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"type {type(obj).__name__} is not json serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    # naive datetimes are serialized as isoformat without offset like jsonable_encoder does
+    return orjson.dumps(obj, default=encode_default)
+
+
+class ORJSONResponse(JSONResponse):
+    """json response encoded by orjson, ObjectId is encoded as str"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class DocumentSerializer:
+    """projects fields of schema straight from raw document of model, fields without alias get schema default"""
+
+    def __init__(self, *, schema: type[BaseSchemaOut], model: type[BaseDBM]):
+        aliases = {name: alias for alias, name in model.get_db_aliases().items()}
+        # [(key in json, alias in document or None, default)]
+        self.fields: list[tuple[str, Any, Any]] = [
+            (f.name, aliases.get(f.name), f.get_default())
+            for f in schema.__fields__.values()
+        ]
+
+    @property
+    def projection(self) -> dict[str, bool]:
+        """only fields of schema are read from db"""
+        projection = {alias: True for _, alias, _ in self.fields if alias is not None}
+        projection.setdefault(BaseFields.oid, False)
+        return projection
+
+    def to_dict(self, doc: Document) -> dict[str, Any]:
+        return {
+            key: default_ if alias is None else doc.get(alias, default_)
+            for key, alias, default_ in self.fields
+        }
+
+    def to_dicts(self, docs: Iterable[Document]) -> list[dict[str, Any]]:
+        return [self.to_dict(doc) for doc in docs]
+
+    def dumps(self, doc: Document) -> bytes:
+        return dumps(self.to_dict(doc))
+
+
+user_out_serializer = DocumentSerializer(schema=UserOut, model=User)
+request_out_serializer = DocumentSerializer(schema=RequestOut, model=Request)
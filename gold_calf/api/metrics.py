@@ -0,0 +1,321 @@
+"""
+process metrics in prometheus text exposition format,
+with settings.metrics_dirpath every worker writes its samples to <metrics_dirpath>/<pid>.json
+and /metrics returns sum of samples of all alive workers
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Optional, Iterable
+
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from gold_calf.core import db, token_cache, mail_outbox
+from gold_calf.db.stats import OperationStats
+
+log = logging.getLogger(__name__)
+
+# starlette appends charset to text media types
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
+# route label of requests which did not match any route, keeps label cardinality bounded
+UNMATCHED_ROUTE = "<unmatched>"
+
+# sample is [name with suffix, labels, value], family is {"name", "type", "help", "samples"} and optional "merge"
+Sample = list
+Family = dict[str, Any]
+
+
+class HTTPStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.__latency: dict[tuple[str, str, str], OperationStats] = {}
+
+    def observe(self, *, method: str, route: str, status_code: int, seconds: float):
+        key = (method, route, str(status_code))
+        stats = self.__latency.get(key)
+        if stats is None:
+            stats = self.__latency[key] = OperationStats()
+        stats.observe(seconds, is_error=status_code >= 500)
+
+    def items(self) -> list[tuple[tuple[str, str, str], OperationStats]]:
+        return list(self.__latency.items())
+
+
+http_stats = HTTPStats()
+
+
+class MetricsMiddleware:
+    """pure asgi middleware, counts requests per route template, does not touch response body"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.__route_paths: Optional[dict[Any, str]] = None
+
+    def __get_route_path(self, scope: Scope) -> str:
+        if self.__route_paths is None:
+            self.__route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint") and hasattr(route, "path")
+            }
+        return self.__route_paths.get(scope.get("endpoint"), UNMATCHED_ROUTE)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_stats.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_stats.in_flight -= 1
+            # router puts matched endpoint to scope
+            http_stats.observe(
+                method=scope["method"],
+                route=self.__get_route_path(scope),
+                status_code=status_code,
+                seconds=time.perf_counter() - started
+            )
+
+
+def make_histogram_samples(name: str, labels: dict[str, str], stats: OperationStats) -> list[Sample]:
+    samples = []
+    cumulative = 0
+    for le, count in zip([*stats.buckets, "+Inf"], stats.bucket_counts):
+        cumulative += count
+        samples.append([f"{name}_bucket", {**labels, "le": str(le)}, cumulative])
+    samples.append([f"{name}_sum", labels, stats.total_seconds])
+    samples.append([f"{name}_count", labels, stats.count])
+    return samples
+
+
+def collect_families() -> list[Family]:
+    """samples of this process, only in-memory counters are read so it is cheap to call on every scrape"""
+    http_requests = {"name": "gold_calf_http_requests_total", "type": "counter", "help": "HTTP requests", "samples": []}
+    http_duration = {
+        "name": "gold_calf_http_request_duration_seconds",
+        "type": "histogram",
+        "help": "HTTP request duration",
+        "samples": []
+    }
+    for (method, route, status_code), stats in http_stats.items():
+        http_requests["samples"].append(
+            [http_requests["name"], {"method": method, "route": route, "status": status_code}, stats.count]
+        )
+        http_duration["samples"] += make_histogram_samples(
+            http_duration["name"], {"method": method, "route": route, "status": status_code}, stats
+        )
+    http_in_flight = {
+        "name": "gold_calf_http_requests_in_flight",
+        "type": "gauge",
+        "help": "HTTP requests being processed",
+        "samples": [["gold_calf_http_requests_in_flight", {}, http_stats.in_flight]]
+    }
+
+    db_duration = {
+        "name": "gold_calf_db_operation_duration_seconds",
+        "type": "histogram",
+        "help": "db operation duration",
+        "samples": []
+    }
+    db_errors = {"name": "gold_calf_db_operation_errors_total", "type": "counter", "help": "failed db operations", "samples": []}
+    for (collection, operation), stats in db.operations_stats.items():
+        labels = {"collection": collection, "operation": operation}
+        db_duration["samples"] += make_histogram_samples(db_duration["name"], labels, stats)
+        db_errors["samples"].append([db_errors["name"], labels, stats.error_count])
+
+    pool = {
+        "name": "gold_calf_db_pool_connections",
+        "type": "gauge",
+        "help": "connections of db connection pool by state",
+        "samples": []
+    }
+    pool_events = {
+        "name": "gold_calf_db_pool_events_total",
+        "type": "counter",
+        "help": "db connection pool events",
+        "samples": []
+    }
+    for address, counters in db.pool_stats.snapshot().items():
+        for state in ["open", "checked_out"]:
+            pool["samples"].append([pool["name"], {"address": address, "state": state}, counters[state]])
+        for event in ["created", "closed", "checkout_failed", "cleared"]:
+            pool_events["samples"].append([pool_events["name"], {"address": address, "event": event}, counters[event]])
+
+    token_cache_stats = token_cache.stats()
+    token_cache_families = [
+        {
+            "name": f"gold_calf_token_cache_{key}_total",
+            "type": "counter",
+            "help": f"token cache {key}",
+            "samples": [[f"gold_calf_token_cache_{key}_total", {}, token_cache_stats[key]]]
+        }
+        for key in ["hits", "misses", "evictions"]
+    ]
+    token_cache_families.append({
+        "name": "gold_calf_token_cache_size",
+        "type": "gauge",
+        "help": "token cache entries",
+        "samples": [["gold_calf_token_cache_size", {}, token_cache_stats["size"]]]
+    })
+
+    mail_families = [
+        {
+            "name": "gold_calf_mail_sent_total",
+            "type": "counter",
+            "help": "mails sent by this process",
+            "samples": [["gold_calf_mail_sent_total", {}, mail_outbox.sent_count]]
+        },
+        {
+            "name": "gold_calf_mail_failed_total",
+            "type": "counter",
+            "help": "mails failed after all retries by this process",
+            "samples": [["gold_calf_mail_failed_total", {}, mail_outbox.failed_count]]
+        },
+        {
+            "name": "gold_calf_mail_send_latency_seconds",
+            "type": "histogram",
+            "help": "seconds from enqueue to send of mails sent by this process",
+            "samples": make_histogram_samples("gold_calf_mail_send_latency_seconds", {}, mail_outbox.send_latency)
+        },
+        {
+            # depth of whole outbox is refreshed periodically in background, so workers report same values
+            "name": "gold_calf_mail_queue_depth",
+            "type": "gauge",
+            "help": "outbox mails by status",
+            "merge": "max",
+            "samples": [
+                ["gold_calf_mail_queue_depth", {"status": status}, count]
+                for status, count in mail_outbox.queue_depth.items()
+            ]
+        }
+    ]
+
+    return [
+        http_requests, http_duration, http_in_flight,
+        db_duration, db_errors, pool, pool_events,
+        *token_cache_families, *mail_families
+    ]
+
+
+def merge_families(families_list: Iterable[list[Family]]) -> list[Family]:
+    """
+    sums samples with same name and labels, gauges are summed too (in-flight, open connections),
+    samples of family with "merge": "max" are not summed but max is taken
+    """
+    merged: dict[str, Family] = {}
+    values: dict[str, dict[tuple, Sample]] = {}
+    for families in families_list:
+        for family in families:
+            if family["name"] not in merged:
+                merged[family["name"]] = {**family, "samples": []}
+                values[family["name"]] = {}
+            family_values = values[family["name"]]
+            for name, labels, value in family["samples"]:
+                key = (name, tuple(sorted(labels.items())))
+                if key in family_values:
+                    if family.get("merge") == "max":
+                        family_values[key][2] = max(family_values[key][2], value)
+                    else:
+                        family_values[key][2] += value
+                else:
+                    family_values[key] = [name, labels, value]
+    for name, family in merged.items():
+        family["samples"] = list(values[name].values())
+    return list(merged.values())
+
+
+def add_token_cache_hit_ratio(families: list[Family]) -> list[Family]:
+    """ratio is not summable so it is calculated from (merged) hits and misses"""
+    totals = {
+        family["name"]: sum(sample[2] for sample in family["samples"])
+        for family in families
+        if family["name"] in ("gold_calf_token_cache_hits_total", "gold_calf_token_cache_misses_total")
+    }
+    hits = totals.get("gold_calf_token_cache_hits_total", 0)
+    misses = totals.get("gold_calf_token_cache_misses_total", 0)
+    return [*families, {
+        "name": "gold_calf_token_cache_hit_ratio",
+        "type": "gauge",
+        "help": "token cache hit ratio",
+        "samples": [["gold_calf_token_cache_hit_ratio", {}, hits / (hits + misses) if hits + misses else 0.0]]
+    }]
+
+
+def format_label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_families(families: list[Family]) -> str:
+    lines = []
+    for family in families:
+        lines.append(f"# HELP {family['name']} {family['help']}")
+        lines.append(f"# TYPE {family['name']} {family['type']}")
+        for name, labels, value in family["samples"]:
+            if labels:
+                labels_str = ",".join(f'{k}="{format_label_value(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{labels_str}}} {value}")
+            else:
+                lines.append(f"{name} {value}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def get_snapshot_filepath(dirpath: str, pid: Optional[int] = None) -> str:
+    return os.path.join(dirpath, f"{os.getpid() if pid is None else pid}.json")
+
+
+def write_snapshot(dirpath: str):
+    """atomically writes samples of this process to shared dir"""
+    os.makedirs(dirpath, exist_ok=True)
+    filepath = get_snapshot_filepath(dirpath)
+    tmp_filepath = filepath + ".tmp"
+    with open(tmp_filepath, "w") as f:
+        json.dump(collect_families(), f)
+    os.replace(tmp_filepath, filepath)
+
+
+def remove_snapshot(dirpath: str):
+    try:
+        os.remove(get_snapshot_filepath(dirpath))
+    except FileNotFoundError:
+        pass
+
+
+def read_snapshots(dirpath: str, max_age: float) -> list[list[Family]]:
+    """snapshots of all workers, snapshots older than max_age (dead workers) are skipped"""
+    res = []
+    now = time.time()
+    for filename in os.listdir(dirpath):
+        if not filename.endswith(".json"):
+            continue
+        filepath = os.path.join(dirpath, filename)
+        try:
+            if now - os.path.getmtime(filepath) > max_age:
+                continue
+            with open(filepath) as f:
+                res.append(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            log.warning(f"can not read metrics snapshot {filepath}: {e}")
+    return res
+
+
+def generate_metrics(dirpath: Optional[str] = None, max_age: float = 60) -> str:
+    """metrics of this process or, if dirpath, of all workers"""
+    if dirpath is None:
+        families = collect_families()
+    else:
+        write_snapshot(dirpath)
+        families = merge_families(read_snapshots(dirpath, max_age=max_age))
+    return render_families(add_token_cache_hit_ratio(families))
@@ -0,0 +1,54 @@
+from typing import AsyncIterator, Callable
+
+from starlette.responses import StreamingResponse
+
+from gold_calf.consts import StreamFormats
+from gold_calf.db.base import Document, TrackedCursor
+
+# documents fetched from mongo per getMore
+STREAM_BATCH_SIZE = 500
+# size of response chunk written to socket
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+async def iter_json_chunks(
+        cursor: TrackedCursor,
+        serialize: Callable[[Document], bytes],
+        format_: str = StreamFormats.json
+) -> AsyncIterator[bytes]:
+    """serialized documents as json array or ndjson, only one chunk and one cursor batch are in memory"""
+    is_json = format_ == StreamFormats.json
+    separator = b"," if is_json else b"\n"
+    chunk = bytearray(b"[" if is_json else b"")
+    is_first = True
+    try:
+        async for doc in cursor:
+            if not is_first and is_json:
+                chunk += separator
+            chunk += serialize(doc)
+            if not is_json:
+                chunk += separator
+            is_first = False
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield bytes(chunk)
+                chunk.clear()
+    finally:
+        # client may disconnect before cursor is exhausted
+        await cursor.close()
+    if is_json:
+        chunk += b"]"
+    if chunk:
+        yield bytes(chunk)
+
+
+def make_streaming_response(
+        cursor: TrackedCursor,
+        serialize: Callable[[Document], bytes],
+        format_: str = StreamFormats.json
+) -> StreamingResponse:
+    if format_ not in StreamFormats.set():
+        raise ValueError(f"format_ is one of {StreamFormats.set()}")
+    return StreamingResponse(
+        iter_json_chunks(cursor=cursor, serialize=serialize, format_=format_),
+        media_type="application/json" if format_ == StreamFormats.json else "application/x-ndjson"
+    )
@@ -3,28 +3,53 @@ from typing import Optional
 
 
 
-from fastapi import APIRouter, HTTPException, Query, status, Depends, Body
+from fastapi import APIRouter, HTTPException, Query, status, Depends, Body, Response
+from pymongo.errors import DuplicateKeyError
 
-from gold_calf.api.deps import get_strict_current_user, make_strict_depends_on_roles
+from gold_calf.api.deps import get_strict_current_user, get_strict_current_full_user, make_strict_depends_on_roles
 from gold_calf.api.chema import OperationStatusOut, SensitiveUserOut, UserOut, UpdateUserIn, \
     UserExistsStatusOut, RegUserIn, AuthUserIn, RequestIn, UpdateRequestIn, \
-        RequestOut, RequestExistsStatusOut, RequestAcceptIn
-from gold_calf.consts import MailCodeTypes, UserRoles
-from gold_calf.core import db
-from gold_calf.db.user import UserFields
+        RequestOut, RequestExistsStatusOut, RequestAcceptIn, ProcessRequestsIn, ProcessRequestsOut, ProcessRequestResultOut, \
+        ClaimedRequestOut
+from gold_calf.api.fast_json import ORJSONResponse, user_out_serializer, request_out_serializer
+from gold_calf.api.metrics import generate_metrics, METRICS_CONTENT_TYPE
+from gold_calf.api.streaming import make_streaming_response, STREAM_BATCH_SIZE
+from gold_calf.consts import MailCodeTypes, UserRoles, NEXT_CURSOR_HEADER, StreamFormats
+from gold_calf.core import settings
+from gold_calf.db.base import Document, BaseFields
 from gold_calf.models import User
-from gold_calf.services import get_user, get_mail_codes, create_mail_code, generate_token, create_user, get_users, \
-    remove_mail_code, update_user, create_request, get_request, update_request, get_requests, proccess_request, remove_request
+from gold_calf.services import get_user, consume_mail_code, create_mail_code, issue_token, create_user, create_users_cursor, \
+    user_with_mail_exists, update_user, revoke_user_signed_tokens, create_request, get_request, user_request_exists, update_request, create_requests_cursor, claim_next_request, proccess_request, process_requests, remove_request
 from gold_calf.utils import send_mail
 
 api_v1_router = APIRouter(prefix="/v1")
 
+MAX_PAGE_LIMIT = 1000
+
+
+def set_next_cursor(*, response: Response, docs: list[Document], limit: Optional[int]):
+    """full page means there can be next page, it starts after int_id of last item"""
+    if limit is not None and len(docs) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(docs[-1][BaseFields.int_id])
+
 
 @api_v1_router.get("/healthcheck")
 async def healthcheck():
     return {"working": True}
 
 
+@api_v1_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(
+        content=generate_metrics(
+            dirpath=settings.metrics_dirpath,
+            # snapshots of dead workers are not updated
+            max_age=settings.metrics_write_interval * 3
+        ),
+        media_type=METRICS_CONTENT_TYPE
+    )
+
+
 """ROLES"""
 
 
@@ -47,7 +72,7 @@ async def send_reg_code(to_mail: str = Query(...)):
         type_=MailCodeTypes.reg
     )
 
-    send_mail(
+    await send_mail(
         to_email=to_mail,
         subject="Регистрация аккаунта",
         text=f'Код для регистрации: {mail_code.code}\n'
@@ -62,27 +87,24 @@ async def reg(
 ):
     reg_user_in.code = reg_user_in.code.strip()
 
-    mail_codes = await get_mail_codes(to_mail=reg_user_in.mail, code=reg_user_in.code)
-    if not mail_codes:
+    mail_code = await consume_mail_code(to_mail=reg_user_in.mail, code=reg_user_in.code, type_=MailCodeTypes.reg)
+    if mail_code is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="not mail_codes")
-    if len(mail_codes) != 1:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="not mail_codes")
-    mail_code = mail_codes[-1]
-
-    await remove_mail_code(to_mail=mail_code.to_mail, code=mail_code.code)
-
-    if mail_code.to_user_oid is not None:
-        user = await get_user(id_=mail_code.to_user_oid)
 
-        if user is not None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="user is not None")
+    if mail_code.to_user is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="user is not None")
 
-    user = await create_user(mail=reg_user_in.mail, auto_create_at_least_one_token=True)
+    try:
+        user = await create_user(mail=reg_user_in.mail, auto_create_at_least_one_token=False)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="user is not None")
+    token = await issue_token(user=user)
     # TODO: tg notify
 
     return SensitiveUserOut.parse_dbm_kwargs(
         **user.dict(),
-        current_token=user.misc_data["created_token"]
+        tokens=[token],
+        current_token=token
     )
 
 
@@ -101,7 +123,7 @@ async def send_auth_code(to_mail: str = Query(...)):
         to_user_oid=user.oid
     )
 
-    send_mail(
+    await send_mail(
         to_email=mail_code.to_mail,
         subject="Вход в аккаунт",
         text=f'Код для входа: {mail_code.code}\n'
@@ -118,29 +140,25 @@ async def auth(
     if auth_user_in.code == "1111":
         user = await get_user(mail=auth_user_in.mail)
     else:
-        mail_codes = await get_mail_codes(to_mail=auth_user_in.mail, code=auth_user_in.code)
-        if not mail_codes:
+        mail_code = await consume_mail_code(
+            to_mail=auth_user_in.mail, code=auth_user_in.code, type_=MailCodeTypes.auth
+        )
+        if mail_code is None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="not mail_codes")
-        if len(mail_codes) != 1:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="len(mail_codes) != 1")
-        mail_code = mail_codes[-1]
-
-        await remove_mail_code(to_mail=mail_code.to_mail, code=mail_code.code)
 
         if mail_code.to_user_oid is None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="mail_code.to_user_oid is None")
 
-        user = await get_user(id_=mail_code.to_user_oid)
+        user = mail_code.to_user
 
     if user is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="user is None")
 
-    token = generate_token()
-    await db.user_collection.update_document_by_id(id_=user.oid, push={UserFields.tokens: token})
-    user.tokens.append(token)
+    token = await issue_token(user=user)
 
     return SensitiveUserOut.parse_dbm_kwargs(
         **user.dict(),
+        tokens=[token],
         current_token=token
     )
 
@@ -149,37 +167,73 @@ async def auth(
 
 
 @api_v1_router.get("/me", response_model=SensitiveUserOut, tags=["Me"])
-async def get_me(user: User = Depends(get_strict_current_user)):
+async def get_me(user: User = Depends(get_strict_current_full_user)):
     return SensitiveUserOut.parse_dbm_kwargs(
         **user.dict(),
+        tokens=[user.misc_data["current_token"]],
         current_token=user.misc_data["current_token"]
     )
 
 @api_v1_router.post('/me.update', response_model=SensitiveUserOut, tags=['Me'])
-async def me_update(update_user_in: UpdateUserIn, user: User = Depends(get_strict_current_user)):
+async def me_update(update_user_in: UpdateUserIn, user: User = Depends(get_strict_current_full_user)):
     update_user_data = update_user_in.dict(exclude_unset=True)
+    current_token = user.misc_data["current_token"]
     user = await update_user(
         user=user,
         **update_user_data
     )
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="user is none")
     return SensitiveUserOut.parse_dbm_kwargs(
-        **(await get_user(id_=user.oid)).dict(),
-        current_token=user.misc_data["current_token"]
+        **user.dict(),
+        tokens=[current_token],
+        current_token=current_token
     )
 
 
 """USER"""
 @api_v1_router.get('/user.mail_exists', response_model=UserExistsStatusOut, tags=['User'])
 async def user_mail_exists(mail: str = Query(...)):
-    user = await get_user(mail=mail)
-    if user is not None:
+    if await user_with_mail_exists(mail=mail):
         return UserExistsStatusOut(is_exists=True)
     return UserExistsStatusOut(is_exists=False)
 
 
 @api_v1_router.get('/user.all', response_model=list[UserOut], tags=['User'])
-async def get_all_users(user: User = Depends(make_strict_depends_on_roles(roles=[UserRoles.hr, UserRoles.dev]))):
-    return [UserOut.parse_dbm_kwargs(**user.dict()) for user in await get_users()]
+async def get_all_users(
+        role: Optional[str] = Query(None),
+        is_accepted: Optional[bool] = Query(None),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after_int_id: Optional[int] = Query(None, description=f"value of {NEXT_CURSOR_HEADER} header of previous page"),
+        stream: bool = Query(False, description="stream all matched users without holding them in memory"),
+        stream_format: str = Query(StreamFormats.json, description=f"one of {sorted(StreamFormats.set())}"),
+        user: User = Depends(make_strict_depends_on_roles(roles=[UserRoles.hr, UserRoles.dev]))
+):
+    if stream is True:
+        if stream_format not in StreamFormats.set():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid stream_format")
+        cursor = create_users_cursor(
+            roles=role,
+            is_accepted=is_accepted,
+            after_int_id=after_int_id,
+            limit=limit,
+            batch_size=STREAM_BATCH_SIZE,
+            projection=user_out_serializer.projection
+        )
+        return make_streaming_response(cursor=cursor, serialize=user_out_serializer.dumps, format_=stream_format)
+
+    # raw documents are serialized directly, response_model is used only for docs
+    cursor = create_users_cursor(
+        roles=role,
+        is_accepted=is_accepted,
+        after_int_id=after_int_id,
+        limit=limit,
+        projection=user_out_serializer.projection
+    )
+    docs = await cursor.to_list(length=None)
+    response = ORJSONResponse(content=user_out_serializer.to_dicts(docs))
+    set_next_cursor(response=response, docs=docs, limit=limit)
+    return response
 
 
 @api_v1_router.get('/user.by_id', response_model=Optional[UserOut], tags=['User'])
@@ -196,13 +250,13 @@ async def edit_user_role(
         user_int_id: int = Query(...),
         role: str = Query(...)
 ):
-    user = await get_user(id_=user_int_id)
-    if user is None:
-        raise HTTPException(status_code=400, detail="user is none")
     if not role in UserRoles.set():
         raise HTTPException(status_code=400, detail="invalid role")
-    await db.user_collection.update_document_by_id(id_=user.oid, set_={UserFields.roles: [role]})
-    return UserOut.parse_dbm_kwargs(**(await get_user(id_=user.oid)).dict())
+    user = await update_user(user=user_int_id, roles=[role])
+    if user is None:
+        raise HTTPException(status_code=400, detail="user is none")
+    await revoke_user_signed_tokens(user_oid=user.oid)
+    return UserOut.parse_dbm_kwargs(**user.dict())
 
 
 """REQUEST"""
@@ -210,37 +264,69 @@ async def edit_user_role(
 async def send_request(
         reg_request_in: RequestIn = Body(...), user: User = Depends(get_strict_current_user)
 ):
-    if await get_request(user_id=user.int_id) is not None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="you alredy send")
-
     create_request_data = reg_request_in.dict(exclude_unset=True)
-    request = await create_request(
-        user_id=user.int_id,
-        **create_request_data
-    )
+    try:
+        await create_request(
+            user_id=user.int_id,
+            **create_request_data
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="you alredy send")
     return OperationStatusOut(is_done=True)
 
 @api_v1_router.post('/update_request', response_model=OperationStatusOut, tags=['Request'])
 async def request_update(update_request_in: UpdateRequestIn, user: User = Depends(get_strict_current_user)):
-    request = await get_request(user_id=user.int_id)
-    if request is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="request not exist")
-    
     update_request_data = update_request_in.dict(exclude_unset=True)
-    user = await update_request(
+    request = await update_request(
         user=user,
         **update_request_data
     )
+    if request is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="request not exist")
     return OperationStatusOut(is_done=True)
 
 @api_v1_router.post('/get_requests', response_model=list[RequestOut], tags=['Request'])
-async def get_requests_route(user: User = Depends(make_strict_depends_on_roles(roles=[UserRoles.hr, UserRoles.dev]))):
-     return [RequestOut.parse_dbm_kwargs(**user.dict()) for user in await get_requests()]
+async def get_requests_route(
+        is_accepted: Optional[bool] = Query(None),
+        job_title: Optional[str] = Query(None),
+        experience_level: Optional[str] = Query(None),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        after_int_id: Optional[int] = Query(None, description=f"value of {NEXT_CURSOR_HEADER} header of previous page"),
+        stream: bool = Query(False, description="stream all matched requests without holding them in memory"),
+        stream_format: str = Query(StreamFormats.json, description=f"one of {sorted(StreamFormats.set())}"),
+        user: User = Depends(make_strict_depends_on_roles(roles=[UserRoles.hr, UserRoles.dev]))
+):
+    if stream is True:
+        if stream_format not in StreamFormats.set():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="invalid stream_format")
+        cursor = create_requests_cursor(
+            is_accepted=is_accepted,
+            job_title=job_title,
+            experience_level=experience_level,
+            after_int_id=after_int_id,
+            limit=limit,
+            batch_size=STREAM_BATCH_SIZE,
+            projection=request_out_serializer.projection
+        )
+        return make_streaming_response(cursor=cursor, serialize=request_out_serializer.dumps, format_=stream_format)
+
+    # raw documents are serialized directly, response_model is used only for docs
+    cursor = create_requests_cursor(
+        is_accepted=is_accepted,
+        job_title=job_title,
+        experience_level=experience_level,
+        after_int_id=after_int_id,
+        limit=limit,
+        projection=request_out_serializer.projection
+    )
+    docs = await cursor.to_list(length=None)
+    response = ORJSONResponse(content=request_out_serializer.to_dicts(docs))
+    set_next_cursor(response=response, docs=docs, limit=limit)
+    return response
 
 @api_v1_router.get('/request.exists', response_model=RequestExistsStatusOut, tags=['Request'])
 async def request_exists(user: User = Depends(get_strict_current_user)):
-    request = await get_request(user_id=user.int_id)
-    if request is not None:
+    if await user_request_exists(user_id=user.int_id):
         return RequestExistsStatusOut(is_exists=True)
     return RequestExistsStatusOut(is_exists=False)
 
@@ -255,6 +341,28 @@ async def user_mail_exists(
         return OperationStatusOut(is_done=True)
     return OperationStatusOut(is_done=False)
 
+@api_v1_router.post('/requests.process_bulk', response_model=ProcessRequestsOut, tags=['Request'])
+async def process_requests_bulk(
+        process_requests_in: ProcessRequestsIn = Body(...),
+        user: User = Depends(make_strict_depends_on_roles(roles=[UserRoles.hr, UserRoles.dev]))
+):
+    results = await process_requests(
+        items=[(item.request_id, item.is_accepted) for item in process_requests_in.items]
+    )
+    return ProcessRequestsOut(items=[
+        ProcessRequestResultOut(request_id=item.request_id, is_accepted=item.is_accepted, result=result)
+        for item, result in zip(process_requests_in.items, results)
+    ])
+
+@api_v1_router.post('/request.claim_next', response_model=ClaimedRequestOut, tags=['Request'])
+async def claim_next_request_route(
+        user: User = Depends(make_strict_depends_on_roles(roles=[UserRoles.hr, UserRoles.dev]))
+):
+    request = await claim_next_request(user=user)
+    if request is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="no requests to claim")
+    return ClaimedRequestOut.parse_dbm_kwargs(**request.dict())
+
 @api_v1_router.get('/request.my', response_model=RequestOut, tags=['Request'])
 async def my_reguest(user: User = Depends(get_strict_current_user)):
     request = await get_request(user_id=user.int_id)
@@ -17,6 +17,39 @@ class UserRoles(SetForClass):
 RolesType = Union[set[str], list[str], str]
 
 
+def roles_to_list(roles: RolesType) -> list[str]:
+    if isinstance(roles, str):
+        roles = [roles]
+    elif isinstance(roles, set):
+        roles = list(roles)
+    elif isinstance(roles, list):
+        pass
+    else:
+        raise TypeError("bad type for roles")
+    return roles
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class StreamFormats(SetForClass):
+    json = "json"  # one json array
+    ndjson = "ndjson"  # one json document per line
+
+
 class Modes(SetForClass):
     prod = "prod"
     dev = "dev"
+
+
+class OutboxStatuses(SetForClass):
+    pending = "pending"
+    sending = "sending"
+    sent = "sent"
+    failed = "failed"
+
+
+class ProcessRequestResults(SetForClass):
+    accepted = "accepted"
+    rejected = "rejected"
+    not_found = "not_found"  # request or its user not exists
+    duplicated = "duplicated"  # request_id was already given in same call
@@ -2,8 +2,39 @@ import asyncio
 
 from gold_calf.cache_dir import CacheDir
 from gold_calf.db.db import DB
+from gold_calf.mail_outbox import MailOutbox
+from gold_calf.models import BaseDBM
 from gold_calf.settings import Settings
+from gold_calf.signed_token import RevocationSet
+from gold_calf.ttl_cache import TTLCache
 
 settings = Settings()
-db = DB(mongo_uri=settings.mongo_uri, mongo_db_name=settings.mongo_db_name)
+BaseDBM.validate_documents = settings.validate_db_documents
+db = DB(
+    mongo_uri=settings.mongo_uri,
+    mongo_db_name=settings.mongo_db_name,
+    int_id_block_size=settings.int_id_block_size,
+    slow_operation_threshold=(
+        settings.slow_operation_threshold_ms / 1000 if settings.slow_operation_threshold_ms is not None else None
+    )
+)
 cache_dir = CacheDir(settings.cache_dirpath)
+# cached users are indexed by oid, so all tokens of user are invalidated without scan
+token_cache = TTLCache(
+    maxsize=settings.token_cache_maxsize, ttl=settings.token_cache_ttl, index_key=lambda user: user.oid
+)
+revocations = RevocationSet()
+mail_outbox = MailOutbox(
+    collection=db.outbox_collection,
+    server=settings.mailru_server,
+    port=settings.mailru_port,
+    login=settings.mailru_login,
+    password=settings.mailru_password,
+    use_ssl=settings.mailru_use_ssl,
+    workers=settings.mail_workers,
+    batch_size=settings.mail_batch_size,
+    max_retries=settings.mail_max_retries,
+    retry_backoff=settings.mail_retry_backoff,
+    poll_interval=settings.mail_poll_interval,
+    lease_seconds=settings.mail_lease_seconds
+)
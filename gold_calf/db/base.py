@@ -1,23 +1,95 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
 from datetime import datetime
 from typing import Union, Any, Optional
 
 import pymongo
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCursor, AsyncIOMotorDatabase
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, UpdateOne
 from pymongo.cursor import Cursor
+from pymongo.errors import DuplicateKeyError
 from pymongo.database import Database
-from pymongo.results import InsertOneResult
+from pymongo.results import InsertOneResult, InsertManyResult, BulkWriteResult, UpdateResult
 
+from gold_calf.db.stats import operations_stats, Operations
 from gold_calf.helpers import SetForClass
 
 Document = dict[str, Any]
 Filter = dict[str, Any]
 Sort = list[tuple[str, int]]
 Id = Union[int, str, ObjectId]
+# list of fields or {field: True/False}, None means whole document
+Projection = Union[list[str], dict[str, Any]]
+
+
+class TrackedCursor:
+    """
+    motor cursor which tracks time spent in fetching of all its documents as one find,
+    find is tracked when cursor is exhausted or closed, other attributes are of motor cursor
+    """
+
+    def __init__(self, *, cursor: AsyncIOMotorCursor, collection_name: str, filter_: Optional[Filter] = None):
+        self.__cursor = cursor
+        self.__collection_name = collection_name
+        self.__filter = filter_
+        self.__seconds = 0.0
+        self.__is_observed = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__cursor, name)
+
+    def __observe(self, is_error: bool = False):
+        if self.__is_observed:
+            return
+        self.__is_observed = True
+        operations_stats.observe(
+            collection=self.__collection_name,
+            operation=Operations.find,
+            seconds=self.__seconds,
+            is_error=is_error,
+            filter_=self.__filter
+        )
+
+    def __aiter__(self) -> TrackedCursor:
+        return self
+
+    async def __anext__(self) -> Document:
+        started = time.perf_counter()
+        try:
+            document = await self.__cursor.next()
+        except StopAsyncIteration:
+            self.__seconds += time.perf_counter() - started
+            self.__observe()
+            raise
+        except Exception:
+            self.__seconds += time.perf_counter() - started
+            self.__observe(is_error=True)
+            raise
+        self.__seconds += time.perf_counter() - started
+        return document
+
+    async def to_list(self, length: Optional[int]) -> list[Document]:
+        started = time.perf_counter()
+        try:
+            documents = await self.__cursor.to_list(length=length)
+        except Exception:
+            self.__seconds += time.perf_counter() - started
+            self.__observe(is_error=True)
+            raise
+        self.__seconds += time.perf_counter() - started
+        # fewer documents than length means cursor is exhausted
+        if length is None or len(documents) < length:
+            self.__observe()
+        return documents
+
+    async def close(self):
+        """tracks find if cursor was not exhausted"""
+        self.__observe()
+        await self.__cursor.close()
 
 
 class SeqFields:
@@ -42,6 +114,9 @@ class SeqCollection:
     def from_mongo_db(cls, mongo_db: AsyncIOMotorDatabase) -> SeqCollection:
         return cls(mongo_db)
 
+    def _track(self, operation: str, filter_: Optional[Filter] = None):
+        return operations_stats.track(collection=self.collection_name, operation=operation, filter_=filter_)
+
     async def ensure_indexes(self):
         await self.motor_collection.create_index(
             [(SeqFields.collection, pymongo.ASCENDING)],
@@ -65,16 +140,21 @@ class SeqCollection:
     async def insert_document(self, document: Document) -> Document:
         if BaseFields.oid in document and not isinstance(document[BaseFields.oid], ObjectId):
             del document[BaseFields.oid]
-        inserted: InsertOneResult = await self.motor_collection.insert_one(document)
+        with self._track(Operations.insert):
+            inserted: InsertOneResult = await self.motor_collection.insert_one(document)
         document[BaseFields.oid] = inserted.inserted_id
         return document
 
     async def count_documents(self, filter_: Optional[Filter] = None) -> int:
         filter_ = self.__normalize_filter(filter_)
-        return await self.motor_collection.count_documents(filter_)
+        with self._track(Operations.count, filter_):
+            return await self.motor_collection.count_documents(filter_)
 
     async def document_exists(self, filter_: Optional[Filter] = None) -> bool:
-        return await self.count_documents(filter_) > 0
+        """find_one with _id only, stops at first match unlike count_documents"""
+        filter_ = self.__normalize_filter(filter_)
+        with self._track(Operations.find, filter_):
+            return await self.motor_collection.find_one(filter_, {SeqFields.oid: True}) is not None
 
     async def collection_with_key_exists(self, *, collection_name: str, key: str) -> bool:
         return await self.document_exists(
@@ -86,7 +166,8 @@ class SeqCollection:
 
     async def update_document(self, filter_: Filter, set_: Document):
         filter_ = self.__normalize_filter(filter_)
-        await self.motor_collection.update_one(filter_, {'$set': set_})
+        with self._track(Operations.update, filter_):
+            await self.motor_collection.update_one(filter_, {'$set': set_})
 
     def create_cursor(
             self,
@@ -94,17 +175,18 @@ class SeqCollection:
             filter_: Filter = None,
             limit: int = None,
             skip: int = None,
-            sort_: Sort = None
-    ) -> AsyncIOMotorCursor:
+            sort_: Sort = None,
+            projection: Optional[Projection] = None
+    ) -> TrackedCursor:
         filter_ = self.__normalize_filter(filter_)
-        cursor: Cursor = self.motor_collection.find(filter_)
+        cursor: Cursor = self.motor_collection.find(filter_, projection)
         if limit is not None:
             cursor = cursor.limit(limit)
         if skip is not None:
             cursor = cursor.skip(skip)
         if sort_ is not None:
             cursor = cursor.sort(sort_)
-        return cursor
+        return TrackedCursor(cursor=cursor, collection_name=self.collection_name, filter_=filter_)
 
     async def update_last_value(self, *, collection: str, key: str, last_value: Any):
         filter_ = {
@@ -116,6 +198,67 @@ class SeqCollection:
             set_={SeqFields.last_value: last_value}
         )
 
+    async def max_last_value(self, *, collection: str, key: str, value: Any):
+        """atomically sets last_value to value if value is greater"""
+        with self._track(Operations.update):
+            await self.motor_collection.update_one(
+                {SeqFields.collection: collection, SeqFields.key: key},
+                {"$max": {SeqFields.last_value: value}}
+            )
+
+    async def increment_last_value(self, *, collection: str, key: str, count: int = 1) -> int:
+        """atomically adds count to last_value and returns new last_value"""
+        # tracked as operation of collection which ids are generated
+        with operations_stats.track(collection=collection, operation=Operations.seq_inc):
+            seq_doc = await self.motor_collection.find_one_and_update(
+                filter={SeqFields.collection: collection, SeqFields.key: key},
+                update={"$inc": {SeqFields.last_value: count}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        return seq_doc[SeqFields.last_value]
+
+
+class IntIdAllocator:
+    """
+    hi/lo allocator, reserves block_size ids in seq collection with one $inc
+    and hands them out locally, ids stay unique across processes but are not ordered by time
+    """
+
+    def __init__(self, *, seq_collection: SeqCollection, collection_name: str, key: str, block_size: int = 1):
+        if block_size < 1:
+            raise ValueError("block_size < 1")
+        self.seq_collection = seq_collection
+        self.collection_name = collection_name
+        self.key = key
+        self.block_size = block_size
+        self.__next_value = 1
+        self.__last_value = 0
+        self.__lock = asyncio.Lock()
+
+    async def reserve(self, count: int) -> int:
+        """reserves count contiguous ids in seq collection and returns first of them"""
+        last_value = await self.seq_collection.increment_last_value(
+            collection=self.collection_name, key=self.key, count=count
+        )
+        return last_value - count + 1
+
+    async def next(self) -> int:
+        async with self.__lock:
+            if self.__next_value > self.__last_value:
+                self.__next_value = await self.reserve(self.block_size)
+                self.__last_value = self.__next_value + self.block_size - 1
+            value = self.__next_value
+            self.__next_value += 1
+            return value
+
+    async def skip_to(self, value: int):
+        """ids <= value are not handed out from local block anymore, call after value was used explicitly"""
+        async with self.__lock:
+            if value >= self.__next_value:
+                # block is reserved again by next() if value is out of it, seq is already >= value
+                self.__next_value = value + 1
+
 
 class BaseFields(SetForClass):
     oid = "_id"
@@ -125,13 +268,20 @@ class BaseFields(SetForClass):
 
 class BaseCollection:
     COLLECTION_NAME = 'base'
+    INT_ID_INDEX_NAME = "int_id_1"
 
-    def __init__(self, *, motor_db: AsyncIOMotorDatabase, pymongo_db: Database):
+    def __init__(self, *, motor_db: AsyncIOMotorDatabase, pymongo_db: Database, int_id_block_size: int = 1):
         self.motor_db = motor_db
         self.pymongo_db = pymongo_db
         self.motor_collection = motor_db.get_collection(self.COLLECTION_NAME)
         self.pymongo_collection = pymongo_db.get_collection(self.COLLECTION_NAME)
         self._seq_collection = SeqCollection(motor_db)
+        self._int_id_allocator = IntIdAllocator(
+            seq_collection=self._seq_collection,
+            collection_name=self.collection_name,
+            key=BaseFields.int_id,
+            block_size=int_id_block_size
+        )
         self.log = logging.getLogger(f'collection_{self.motor_collection.name}')
 
     @property
@@ -139,14 +289,32 @@ class BaseCollection:
         return self.motor_collection.name
 
     @classmethod
-    def from_mongo_db(cls, motor_db: AsyncIOMotorDatabase, pymongo_db: Database) -> BaseCollection:
-        return cls(motor_db=motor_db, pymongo_db=pymongo_db)
+    def from_mongo_db(
+            cls, motor_db: AsyncIOMotorDatabase, pymongo_db: Database, int_id_block_size: int = 1
+    ) -> BaseCollection:
+        return cls(motor_db=motor_db, pymongo_db=pymongo_db, int_id_block_size=int_id_block_size)
+
+    def _track(self, operation: str, filter_: Optional[Filter] = None):
+        return operations_stats.track(collection=self.collection_name, operation=operation, filter_=filter_)
 
     async def ensure_indexes(self):
-        await self.motor_collection.create_index(
-            [(BaseFields.int_id, pymongo.ASCENDING)],
-            unique=True, sparse=True
-        )
+        # every document has int_id, index is not sparse so it serves sort by int_id of unfiltered queries
+        # (planner does not use sparse index when it can miss documents)
+        int_id_index = (await self.motor_collection.index_information()).get(self.INT_ID_INDEX_NAME)
+        if int_id_index is not None and int_id_index.get("sparse") is True:
+            await self.motor_collection.drop_index(self.INT_ID_INDEX_NAME)
+            self.log.info(f"sparse index '{self.INT_ID_INDEX_NAME}' was dropped on '{self.collection_name}'")
+        try:
+            await self.motor_collection.create_index(
+                [(BaseFields.int_id, pymongo.ASCENDING)],
+                name=self.INT_ID_INDEX_NAME,
+                unique=True
+            )
+        except DuplicateKeyError as e:
+            self.log.error(
+                f"unique index on '{BaseFields.int_id}' was not created on '{self.collection_name}', "
+                f"set int_id of documents without it: {e}"
+            )
         await self._seq_collection.ensure_indexes()
 
         # create seq for int_id
@@ -173,17 +341,21 @@ class BaseCollection:
             filter_: Filter = None,
             limit: int = None,
             skip: int = None,
-            sort_: Sort = None
-    ) -> AsyncIOMotorCursor:
+            sort_: Sort = None,
+            batch_size: int = None,
+            projection: Optional[Projection] = None
+    ) -> TrackedCursor:
         filter_ = self.__normalize_filter(filter_)
-        cursor: Cursor = self.motor_collection.find(filter_)
+        cursor: Cursor = self.motor_collection.find(filter_, projection)
         if limit is not None:
             cursor = cursor.limit(limit)
         if skip is not None:
             cursor = cursor.skip(skip)
         if sort_ is not None:
             cursor = cursor.sort(sort_)
-        return cursor
+        if batch_size is not None:
+            cursor = cursor.batch_size(batch_size)
+        return TrackedCursor(cursor=cursor, collection_name=self.collection_name, filter_=filter_)
 
     def create_id_filter(
             self,
@@ -202,74 +374,202 @@ class BaseCollection:
             raise ValueError('id_ is int or ObjectId')
         return filter_
 
+    @staticmethod
+    def make_key_filter(document: Document, key_fields: list[str]) -> Filter:
+        """filter of upsert_documents for document"""
+        return {key: document[key] for key in key_fields}
+
+    @staticmethod
+    def make_keys_filter(documents: list[Document], key_fields: list[str]) -> Filter:
+        """filter of existing documents with keys of documents in upsert_documents"""
+        if len(key_fields) == 1:
+            return {key_fields[0]: {"$in": [doc[key_fields[0]] for doc in documents]}}
+        return {"$or": [BaseCollection.make_key_filter(doc, key_fields) for doc in documents]}
+
+    @staticmethod
+    def make_covered_projection(index_fields: list[str]) -> Projection:
+        """projection of find_covered_document"""
+        projection = {field: True for field in index_fields}
+        if BaseFields.oid not in index_fields:
+            projection[BaseFields.oid] = False
+        return projection
+
     async def generate_int_id(self) -> int:
-        seq_doc = await self._seq_collection.motor_collection.find_one_and_update(
-            filter={SeqFields.collection: self.collection_name, SeqFields.key: BaseFields.int_id},
-            update={"$inc": {SeqFields.last_value: 1}},
-            return_document=ReturnDocument.AFTER
-        )
-        return seq_doc[SeqFields.last_value]
+        return await self._int_id_allocator.next()
 
     async def insert_document(self, document: Document) -> Document:
         if BaseFields.int_id not in document:
             document[BaseFields.int_id] = await self.generate_int_id()
         else:
-            cursor = self.create_cursor(
-                filter_={},
-                sort_=[(BaseFields.int_id, pymongo.DESCENDING)],
-                limit=1
-            )
-            int_ids = [doc[BaseFields.int_id] async for doc in cursor]
-            int_ids.append(document[BaseFields.int_id])
-            int_ids.sort()
-            max_int_id = int_ids[-1]
-            await self._seq_collection.update_last_value(
+            await self._seq_collection.max_last_value(
                 collection=self.collection_name,
                 key=BaseFields.int_id,
-                last_value=max_int_id
+                value=document[BaseFields.int_id]
             )
+            await self._int_id_allocator.skip_to(document[BaseFields.int_id])
 
         if BaseFields.created not in document:
             document[BaseFields.created] = datetime.utcnow()
         if BaseFields.oid in document and not isinstance(document[BaseFields.oid], ObjectId):
             del document[BaseFields.oid]
-        inserted: InsertOneResult = await self.motor_collection.insert_one(document)
+        with self._track(Operations.insert):
+            inserted: InsertOneResult = await self.motor_collection.insert_one(document)
         document[BaseFields.oid] = inserted.inserted_id
         return document
 
+    async def insert_documents(
+            self, documents: list[Document], ordered: bool = False, chunk_size: int = 1000
+    ) -> list[Document]:
+        """
+        inserts documents with insert_many by chunks of chunk_size,
+        int_ids for documents without it are reserved as one contiguous range by one seq update
+        """
+        if not documents:
+            return documents
+
+        without_int_id = [doc for doc in documents if BaseFields.int_id not in doc]
+        if without_int_id:
+            first_int_id = await self._int_id_allocator.reserve(len(without_int_id))
+            for i, doc in enumerate(without_int_id):
+                doc[BaseFields.int_id] = first_int_id + i
+        if len(without_int_id) != len(documents):
+            max_int_id = max(doc[BaseFields.int_id] for doc in documents)
+            await self._seq_collection.max_last_value(
+                collection=self.collection_name,
+                key=BaseFields.int_id,
+                value=max_int_id
+            )
+            await self._int_id_allocator.skip_to(max_int_id)
+
+        now = datetime.utcnow()
+        for doc in documents:
+            if BaseFields.created not in doc:
+                doc[BaseFields.created] = now
+            if BaseFields.oid in doc and not isinstance(doc[BaseFields.oid], ObjectId):
+                del doc[BaseFields.oid]
+
+        for i in range(0, len(documents), chunk_size):
+            chunk = documents[i:i + chunk_size]
+            with self._track(Operations.insert):
+                inserted: InsertManyResult = await self.motor_collection.insert_many(chunk, ordered=ordered)
+            for doc, oid in zip(chunk, inserted.inserted_ids):
+                doc[BaseFields.oid] = oid
+        return documents
+
+    async def upsert_documents(
+            self, documents: list[Document], key_fields: list[str], ordered: bool = False
+    ) -> int:
+        """
+        inserts documents which do not exist by key_fields with one bulk write,
+        existing documents are not changed, returns count of inserted,
+        int_ids are reserved only for documents which do not exist
+        """
+        if not documents:
+            return 0
+
+        # documents with same key as previous one in batch or in collection are not inserted
+        docs_by_key: dict[tuple, Document] = {}
+        for doc in documents:
+            docs_by_key.setdefault(tuple(doc[key] for key in key_fields), doc)
+        existing_keys = set()
+        cursor = self.create_cursor(
+            filter_=self.make_keys_filter(list(docs_by_key.values()), key_fields),
+            projection=self.make_covered_projection(key_fields)
+        )
+        for existing_doc in await cursor.to_list(length=None):
+            existing_keys.add(tuple(existing_doc.get(key) for key in key_fields))
+        documents = [doc for key, doc in docs_by_key.items() if key not in existing_keys]
+        if not documents:
+            return 0
+
+        without_int_id = [doc for doc in documents if BaseFields.int_id not in doc]
+        first_int_id = None
+        if without_int_id:
+            first_int_id = await self._int_id_allocator.reserve(len(without_int_id))
+        if len(without_int_id) != len(documents):
+            max_int_id = max(doc[BaseFields.int_id] for doc in documents if BaseFields.int_id in doc)
+            await self._seq_collection.max_last_value(
+                collection=self.collection_name,
+                key=BaseFields.int_id,
+                value=max_int_id
+            )
+            await self._int_id_allocator.skip_to(max_int_id)
+
+        now = datetime.utcnow()
+        operations = []
+        i = 0
+        for doc in documents:
+            doc = {k: v for k, v in doc.items() if k != BaseFields.oid}
+            if BaseFields.int_id not in doc:
+                doc[BaseFields.int_id] = first_int_id + i
+                i += 1
+            doc.setdefault(BaseFields.created, now)
+            operations.append(UpdateOne(
+                self.make_key_filter(doc, key_fields),
+                {"$setOnInsert": doc},
+                upsert=True
+            ))
+        # all operations are filtered by key_fields, document inserted concurrently after lookup is not changed
+        with self._track(Operations.update, self.make_key_filter(documents[0], key_fields)):
+            result: BulkWriteResult = await self.motor_collection.bulk_write(operations, ordered=ordered)
+        return result.upserted_count
+
+    async def bulk_write(self, operations: list[Any], ordered: bool = False) -> Optional[BulkWriteResult]:
+        """one round trip for many UpdateOne/DeleteOne/... operations, None if operations is empty"""
+        if not operations:
+            return None
+        with self._track(Operations.update):
+            return await self.motor_collection.bulk_write(operations, ordered=ordered)
+
     async def find_document(
-            self, filter_: Optional[Filter] = None
+            self, filter_: Optional[Filter] = None, projection: Optional[Projection] = None
     ) -> Optional[Document]:
         filter_ = self.__normalize_filter(filter_)
-        document = await self.motor_collection.find_one(filter_)
+        with self._track(Operations.find, filter_):
+            document = await self.motor_collection.find_one(filter_, projection)
         return document
 
     async def find_document_by_id(
-            self, id_: Id
+            self, id_: Id, projection: Optional[Projection] = None
     ) -> Optional[Document]:
         filter_ = self.create_id_filter(id_)
-        return await self.find_document(filter_)
+        return await self.find_document(filter_, projection=projection)
 
     async def find_document_by_oid(
-            self, oid: ObjectId
+            self, oid: ObjectId, projection: Optional[Projection] = None
     ) -> Optional[Document]:
-        return await self.find_document({BaseFields.oid: oid})
+        return await self.find_document({BaseFields.oid: oid}, projection=projection)
 
     async def find_document_by_int_id(
-            self, int_id: int
+            self, int_id: int, projection: Optional[Projection] = None
     ) -> Optional[Document]:
-        return await self.find_document({BaseFields.int_id: int_id})
+        return await self.find_document({BaseFields.int_id: int_id}, projection=projection)
 
-    async def get_all_docs(self) -> list[Document]:
-        cursor = self.create_cursor()
+    async def find_covered_document(self, filter_: Filter, index_fields: list[str]) -> Optional[Document]:
+        """
+        document with only index_fields, if index on them serves filter_ it is index-only query
+        (no document is fetched), index_fields must not be array fields
+        """
+        return await self.find_document(filter_, projection=self.make_covered_projection(index_fields))
+
+    async def get_all_docs(self, projection: Optional[Projection] = None) -> list[Document]:
+        cursor = self.create_cursor(projection=projection)
         return [doc async for doc in cursor]
 
     async def count_documents(self, filter_: Optional[Filter] = None) -> int:
+        """exact count, scans all matched index keys or documents, use estimated_count for whole collection"""
         filter_ = self.__normalize_filter(filter_)
-        return await self.motor_collection.count_documents(filter_)
+        with self._track(Operations.count, filter_):
+            return await self.motor_collection.count_documents(filter_)
+
+    async def estimated_count(self) -> int:
+        """count of all documents from collection metadata, can be inaccurate after unclean shutdown"""
+        with self._track(Operations.count):
+            return await self.motor_collection.estimated_document_count()
 
     async def document_exists(self, filter_: Optional[Filter] = None) -> bool:
-        return await self.count_documents(filter_) > 0
+        """find_one with _id only, stops at first match unlike count_documents"""
+        return await self.find_document(filter_, projection=[BaseFields.oid]) is not None
 
     async def id_exists(self, id_: Id) -> bool:
         return await self.document_exists(self.create_id_filter(id_))
@@ -280,9 +580,28 @@ class BaseCollection:
     async def oid_exists(self, oid: Optional[ObjectId]) -> bool:
         return await self.document_exists({BaseFields.oid: oid})
 
-    async def update_document(self, filter_: Filter, set_: Document):
+    async def update_document(self, filter_: Filter, set_: Document, unset: Optional[list[str]] = None):
+        filter_ = self.__normalize_filter(filter_)
+        update = {'$set': set_}
+        if unset is not None:
+            update['$unset'] = {field: "" for field in unset}
+        with self._track(Operations.update, filter_):
+            await self.motor_collection.update_one(filter_, update)
+
+    async def update_documents(self, filter_: Filter, set_: Document, unset: Optional[list[str]] = None) -> int:
+        """update_many, returns count of modified"""
         filter_ = self.__normalize_filter(filter_)
-        await self.motor_collection.update_one(filter_, {'$set': set_})
+        update = {'$set': set_}
+        if unset is not None:
+            update['$unset'] = {field: "" for field in unset}
+        with self._track(Operations.update, filter_):
+            result: UpdateResult = await self.motor_collection.update_many(filter_, update)
+        return result.modified_count
+
+    async def aggregate(self, pipeline: list[Document]) -> list[Document]:
+        """all documents of aggregation result, result is expected to be small"""
+        with self._track(Operations.aggregate, pipeline[0] if pipeline else None):
+            return await self.motor_collection.aggregate(pipeline).to_list(length=None)
 
     async def update_document_by_id(self, id_: Id, set_: Optional[Document] = None, push: Optional[Document] = None):
         if set_ is None and push is None:
@@ -295,7 +614,48 @@ class BaseCollection:
         if push is not None:
             update["$push"] = push
 
-        await self.motor_collection.update_one(filter_, update)
+        with self._track(Operations.update, filter_):
+            await self.motor_collection.update_one(filter_, update)
+
+    async def find_and_update_document(
+            self,
+            filter_: Filter,
+            set_: Optional[Document] = None,
+            push: Optional[Document] = None,
+            sort_: Sort = None,
+            return_updated: bool = True,
+            projection: Optional[Projection] = None
+    ) -> Optional[Document]:
+        """atomically updates first document by filter_ and returns it (after update if return_updated), one round trip"""
+        if set_ is None and push is None:
+            raise ValueError("set_ is None and push is None")
+
+        filter_ = self.__normalize_filter(filter_)
+        update = {}
+        if set_ is not None:
+            update["$set"] = set_
+        if push is not None:
+            update["$push"] = push
+
+        with self._track(Operations.update, filter_):
+            return await self.motor_collection.find_one_and_update(
+                filter_,
+                update,
+                projection=projection,
+                sort=sort_,
+                return_document=ReturnDocument.AFTER if return_updated else ReturnDocument.BEFORE
+            )
+
+    async def find_and_update_document_by_id(
+            self,
+            id_: Id,
+            set_: Optional[Document] = None,
+            push: Optional[Document] = None,
+            projection: Optional[Projection] = None
+    ) -> Optional[Document]:
+        return await self.find_and_update_document(
+            self.create_id_filter(id_=id_), set_=set_, push=push, projection=projection
+        )
 
     async def update_document_by_oid(self, oid: ObjectId, set_: Document):
         await self.update_document({BaseFields.oid: oid}, set_)
@@ -305,7 +665,16 @@ class BaseCollection:
 
     async def remove_document(self, filter_: Filter):
         filter_ = self.__normalize_filter(filter_)
-        await self.motor_collection.delete_one(filter_)
+        with self._track(Operations.delete, filter_):
+            await self.motor_collection.delete_one(filter_)
+
+    async def find_and_remove_document(
+            self, filter_: Optional[Filter] = None, sort_: Sort = None, projection: Optional[Projection] = None
+    ) -> Optional[Document]:
+        """atomically removes first document by filter_ and sort_ and returns it"""
+        filter_ = self.__normalize_filter(filter_)
+        with self._track(Operations.delete, filter_):
+            return await self.motor_collection.find_one_and_delete(filter_, projection=projection, sort=sort_)
 
     async def remove_by_id(self, id_: Id):
         await self.remove_document(self.create_id_filter(id_))
@@ -318,7 +687,8 @@ class BaseCollection:
 
     async def remove_documents(self, filter_: Optional[Filter] = None):
         filter_ = self.__normalize_filter(filter_)
-        await self.motor_collection.delete_many(filter_)
+        with self._track(Operations.delete, filter_):
+            await self.motor_collection.delete_many(filter_)
 
     async def drop_collection(self):
         await self.motor_collection.drop()
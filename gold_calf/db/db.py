@@ -1,13 +1,19 @@
 import asyncio
 import logging
+from typing import Optional
 
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from pymongo import MongoClient
 from pymongo.errors import OperationFailure, ConnectionFailure
 
+from gold_calf.db.import_checkpoint import ImportCheckpointCollection
 from gold_calf.db.mailcode import MailCodeCollection
+from gold_calf.db.outbox import OutboxCollection
 from gold_calf.db.user import UserCollection
 from gold_calf.db.request import RequestCollection
+from gold_calf.db.revocation import RevocationCollection
+from gold_calf.db.session import SessionCollection
+from gold_calf.db.stats import operations_stats, OperationsStats, pool_stats, PoolStats
 
 
 class CannotConnectToDb(Exception):
@@ -15,15 +21,29 @@ class CannotConnectToDb(Exception):
 
 
 class DB:
-    def __init__(self, mongo_uri: str, mongo_db_name: str):
+    def __init__(
+            self,
+            mongo_uri: str,
+            mongo_db_name: str,
+            int_id_block_size: int = 1,
+            slow_operation_threshold: Optional[float] = None
+    ):
         self.log = logging.getLogger(__name__)
 
+        # per (collection, operation) latency stats of all collections, process wide
+        self.operations_stats: OperationsStats = operations_stats
+        self.operations_stats.slow_threshold = slow_operation_threshold
+        # connection pool counters of both clients
+        self.pool_stats: PoolStats = pool_stats
+
         # pymongo client
-        self.pymongo_client = MongoClient(mongo_uri)
+        self.pymongo_client = MongoClient(mongo_uri, event_listeners=[self.pool_stats])
         self.pymongo_db = self.pymongo_client.get_database(mongo_db_name)
 
         # motor client
-        self.motor_client: AsyncIOMotorClient = AsyncIOMotorClient(mongo_uri, serverSelectionTimeoutMS=5000)
+        self.motor_client: AsyncIOMotorClient = AsyncIOMotorClient(
+            mongo_uri, serverSelectionTimeoutMS=5000, event_listeners=[self.pool_stats]
+        )
         self.motor_db: AsyncIOMotorDatabase = self.motor_client.get_database(mongo_db_name)
 
         # collections
@@ -31,22 +51,53 @@ class DB:
 
         self.user_collection: UserCollection = UserCollection.from_mongo_db(
             motor_db=self.motor_db,
-            pymongo_db=self.pymongo_db
+            pymongo_db=self.pymongo_db,
+            int_id_block_size=int_id_block_size
         )
         self.collections.append(self.user_collection)
 
         self.mail_code_collection: MailCodeCollection = MailCodeCollection.from_mongo_db(
             motor_db=self.motor_db,
-            pymongo_db=self.pymongo_db
+            pymongo_db=self.pymongo_db,
+            int_id_block_size=int_id_block_size
         )
         self.collections.append(self.mail_code_collection)
 
         self.request_collection: RequestCollection = RequestCollection.from_mongo_db(
             motor_db=self.motor_db,
-            pymongo_db=self.pymongo_db
+            pymongo_db=self.pymongo_db,
+            int_id_block_size=int_id_block_size
         )
         self.collections.append(self.request_collection)
 
+        self.session_collection: SessionCollection = SessionCollection.from_mongo_db(
+            motor_db=self.motor_db,
+            pymongo_db=self.pymongo_db,
+            int_id_block_size=int_id_block_size
+        )
+        self.collections.append(self.session_collection)
+
+        self.revocation_collection: RevocationCollection = RevocationCollection.from_mongo_db(
+            motor_db=self.motor_db,
+            pymongo_db=self.pymongo_db,
+            int_id_block_size=int_id_block_size
+        )
+        self.collections.append(self.revocation_collection)
+
+        self.outbox_collection: OutboxCollection = OutboxCollection.from_mongo_db(
+            motor_db=self.motor_db,
+            pymongo_db=self.pymongo_db,
+            int_id_block_size=int_id_block_size
+        )
+        self.collections.append(self.outbox_collection)
+
+        self.import_checkpoint_collection: ImportCheckpointCollection = ImportCheckpointCollection.from_mongo_db(
+            motor_db=self.motor_db,
+            pymongo_db=self.pymongo_db,
+            int_id_block_size=int_id_block_size
+        )
+        self.collections.append(self.import_checkpoint_collection)
+
     async def ensure_all_indexes(self):
         self.log.info('ensuring all indexes')
         for collection in self.collections:
@@ -0,0 +1,25 @@
+import pymongo
+
+from gold_calf.db.base import BaseCollection, BaseFields
+
+
+class ImportCheckpointFields(BaseFields):
+    filepath = "filepath"
+    content_hash = "content_hash"
+    last_row = "last_row"  # all rows up to this index are committed
+    is_finished = "is_finished"
+    updated = "updated"
+
+
+class ImportCheckpointCollection(BaseCollection):
+    COLLECTION_NAME = "import_checkpoint"
+
+    async def ensure_indexes(self):
+        await super().ensure_indexes()
+        await self.motor_collection.create_index(
+            [
+                (ImportCheckpointFields.filepath, pymongo.ASCENDING),
+                (ImportCheckpointFields.content_hash, pymongo.ASCENDING)
+            ],
+            unique=True
+        )
@@ -12,24 +12,35 @@ class MailCodeFields(BaseFields):
 
 class MailCodeCollection(BaseCollection):
     COLLECTION_NAME = "mail_code"
+    # codes are removed by mongo ttl monitor after this time since creation
+    EXPIRE_AFTER_SECONDS = 60 * 15
+    # codes were globally unique before, now they are unique per to_mail
+    LEGACY_INDEXES = ["code_1", "code_1__id_1"]
 
     async def ensure_indexes(self):
         await super().ensure_indexes()
-        self.motor_collection.create_index(
-            [(MailCodeFields.code, pymongo.ASCENDING)],
-            unique=True, sparse=True
-        )
-        self.motor_collection.create_index(
+        index_information = await self.motor_collection.index_information()
+        for index_name in self.LEGACY_INDEXES:
+            if index_name in index_information:
+                await self.motor_collection.drop_index(index_name)
+                self.log.info(f"legacy index '{index_name}' was dropped on '{self.collection_name}'")
+        await self.motor_collection.create_index(
             [
                 (MailCodeFields.code, pymongo.ASCENDING),
                 (MailCodeFields.to_mail, pymongo.ASCENDING)
             ],
             unique=True, sparse=True
         )
-        self.motor_collection.create_index(
+        await self.motor_collection.create_index(
+            [(MailCodeFields.created, pymongo.ASCENDING)],
+            expireAfterSeconds=self.EXPIRE_AFTER_SECONDS
+        )
+        # for consume_mail_code
+        await self.motor_collection.create_index(
             [
+                (MailCodeFields.to_mail, pymongo.ASCENDING),
                 (MailCodeFields.code, pymongo.ASCENDING),
-                (MailCodeFields.oid, pymongo.ASCENDING)
-            ],
-            unique=True, sparse=True
+                (MailCodeFields.type, pymongo.ASCENDING),
+                (MailCodeFields.created, pymongo.DESCENDING)
+            ]
         )
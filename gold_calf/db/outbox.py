@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pymongo
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from gold_calf.consts import OutboxStatuses
+from gold_calf.db.base import BaseCollection, BaseFields, Document, Filter, Sort
+from gold_calf.db.stats import Operations
+
+
+class OutboxFields(BaseFields):
+    to_mail = "to_mail"
+    subject = "subject"
+    text = "text"
+    status = "status"  # use OutboxStatuses
+    attempts = "attempts"
+    next_attempt_at = "next_attempt_at"
+    claimed_by = "claimed_by"
+    claimed_at = "claimed_at"
+    sent_at = "sent_at"
+    last_error = "last_error"
+
+
+class OutboxCollection(BaseCollection):
+    COLLECTION_NAME = "outbox"
+    # sent mail is removed by mongo ttl monitor after this time
+    SENT_EXPIRE_AFTER_SECONDS = 60 * 60 * 24 * 7
+    CLAIM_SORT: Sort = [(OutboxFields.next_attempt_at, pymongo.ASCENDING)]
+
+    async def ensure_indexes(self):
+        await super().ensure_indexes()
+        await self.motor_collection.create_index(
+            [(OutboxFields.status, pymongo.ASCENDING), (OutboxFields.next_attempt_at, pymongo.ASCENDING)]
+        )
+        await self.motor_collection.create_index(
+            [(OutboxFields.status, pymongo.ASCENDING), (OutboxFields.claimed_at, pymongo.ASCENDING)]
+        )
+        await self.motor_collection.create_index(
+            [(OutboxFields.sent_at, pymongo.ASCENDING)],
+            expireAfterSeconds=self.SENT_EXPIRE_AFTER_SECONDS
+        )
+
+    @staticmethod
+    def make_claimable_filter(*, now: datetime, lease_seconds: float) -> Filter:
+        """due pending mail or mail with expired claim of dead worker"""
+        return {
+            "$or": [
+                {
+                    OutboxFields.status: OutboxStatuses.pending,
+                    OutboxFields.next_attempt_at: {"$lte": now}
+                },
+                {
+                    OutboxFields.status: OutboxStatuses.sending,
+                    OutboxFields.claimed_at: {"$lt": now - timedelta(seconds=lease_seconds)}
+                }
+            ]
+        }
+
+    async def claim_document(self, *, claimed_by: str, lease_seconds: float) -> Optional[Document]:
+        """
+        atomically marks one due pending mail (or mail with expired claim of dead worker)
+        as sending by claimed_by and returns it
+        """
+        now = datetime.utcnow()
+        filter_ = self.make_claimable_filter(now=now, lease_seconds=lease_seconds)
+        with self._track(Operations.update, filter_):
+            return await self.motor_collection.find_one_and_update(
+                filter=filter_,
+                update={"$set": {
+                    OutboxFields.status: OutboxStatuses.sending,
+                    OutboxFields.claimed_by: claimed_by,
+                    OutboxFields.claimed_at: now
+                }},
+                sort=self.CLAIM_SORT,
+                return_document=ReturnDocument.AFTER
+            )
+
+    async def renew_claim(self, *, oid: ObjectId, claimed_by: str) -> bool:
+        """extends claim of mail before it is sent, returns False if claim was taken by other worker"""
+        filter_ = {OutboxFields.oid: oid, OutboxFields.claimed_by: claimed_by}
+        with self._track(Operations.update, filter_):
+            result = await self.motor_collection.update_one(
+                filter_, {"$set": {OutboxFields.claimed_at: datetime.utcnow()}}
+            )
+        return result.matched_count == 1
@@ -1,4 +1,5 @@
 import pymongo
+from pymongo.errors import DuplicateKeyError
 
 from gold_calf.db.base import BaseCollection, BaseFields
 
@@ -13,13 +14,55 @@ class RequestFields(BaseFields):
     job_title = "job_title"
     is_accepted = "is_accepted"
     user_id = "user_id"
+    claimed_by = "claimed_by"  # int_id of reviewer, None if not claimed
+    claim_expires_at = "claim_expires_at"
+    processing_by = "processing_by"  # id of process_requests call which owns request, None if not owned
+    processing_expires_at = "processing_expires_at"
 
 class RequestCollection(BaseCollection):
     COLLECTION_NAME = "request"
+    # (user_id, int_id) did not prevent second request of same user, replaced by unique user_id,
+    # user_id_1 had {$type: "number"} partial filter, planner may not prove that equality queries imply it
+    LEGACY_INDEXES = ["user_id_1_int_id_1", "user_id_1"]
+    USER_ID_INDEX_NAME = "user_id_1_unique"
 
     async def ensure_indexes(self):
         await super().ensure_indexes()
-        self.pymongo_collection.create_index(
-            [(RequestFields.user_id, pymongo.ASCENDING), (RequestFields.int_id, pymongo.ASCENDING)],
-            unique=True, sparse=True
+        index_information = await self.motor_collection.index_information()
+        for index_name in self.LEGACY_INDEXES:
+            if index_name in index_information:
+                await self.motor_collection.drop_index(index_name)
+                self.log.info(f"legacy index '{index_name}' was dropped on '{self.collection_name}'")
+        # one request per user, requests without user are not indexed,
+        # user_id is int_id of user so any query by user_id implies partial filter and can use index
+        try:
+            await self.motor_collection.create_index(
+                [(RequestFields.user_id, pymongo.ASCENDING)],
+                name=self.USER_ID_INDEX_NAME,
+                unique=True,
+                partialFilterExpression={RequestFields.user_id: {"$gt": 0}}
+            )
+        except DuplicateKeyError as e:
+            self.log.error(
+                f"unique index on '{RequestFields.user_id}' was not created on '{self.collection_name}', "
+                f"remove duplicated requests of users: {e}"
+            )
+        await self.motor_collection.create_index(
+            [(RequestFields.mail, pymongo.ASCENDING)]
         )
+        # for claim_next_request, oldest unclaimed and expired claims
+        await self.motor_collection.create_index(
+            [(RequestFields.claimed_by, pymongo.ASCENDING), (RequestFields.created, pymongo.ASCENDING)]
+        )
+        await self.motor_collection.create_index(
+            [(RequestFields.claim_expires_at, pymongo.ASCENDING)], sparse=True
+        )
+        # for process_requests, requests owned by call
+        await self.motor_collection.create_index(
+            [(RequestFields.processing_by, pymongo.ASCENDING)], sparse=True
+        )
+        # for keyset pages of create_requests_cursor
+        for field in [RequestFields.is_accepted, RequestFields.job_title, RequestFields.experience_level]:
+            await self.motor_collection.create_index(
+                [(field, pymongo.ASCENDING), (RequestFields.int_id, pymongo.ASCENDING)]
+            )
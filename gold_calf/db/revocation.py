@@ -0,0 +1,21 @@
+import pymongo
+
+from gold_calf.db.base import BaseCollection, BaseFields
+
+
+class RevocationFields(BaseFields):
+    jti = "jti"  # revoke one signed token
+    user_oid = "user_oid"  # revoke all signed tokens of user issued before revoked_before
+    revoked_before = "revoked_before"
+    expires_at = "expires_at"
+
+
+class RevocationCollection(BaseCollection):
+    COLLECTION_NAME = "revocation"
+
+    async def ensure_indexes(self):
+        await super().ensure_indexes()
+        await self.motor_collection.create_index(
+            [(RevocationFields.expires_at, pymongo.ASCENDING)],
+            expireAfterSeconds=0
+        )
@@ -0,0 +1,28 @@
+import pymongo
+
+from gold_calf.db.base import BaseCollection, BaseFields
+
+
+class SessionFields(BaseFields):
+    token_hash = "token_hash"
+    user_oid = "user_oid"
+
+
+class SessionCollection(BaseCollection):
+    COLLECTION_NAME = "session"
+    # sessions are removed by mongo ttl monitor after this time since creation
+    EXPIRE_AFTER_SECONDS = 60 * 60 * 24 * 30
+
+    async def ensure_indexes(self):
+        await super().ensure_indexes()
+        await self.motor_collection.create_index(
+            [(SessionFields.token_hash, pymongo.ASCENDING)],
+            unique=True
+        )
+        await self.motor_collection.create_index(
+            [(SessionFields.user_oid, pymongo.ASCENDING)]
+        )
+        await self.motor_collection.create_index(
+            [(SessionFields.created, pymongo.ASCENDING)],
+            expireAfterSeconds=self.EXPIRE_AFTER_SECONDS
+        )
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Optional, Iterator
+
+from pymongo import monitoring
+
+from gold_calf.helpers import SetForClass
+
+log = logging.getLogger(__name__)
+
+# upper bounds in seconds, last bucket is +Inf
+LATENCY_BUCKETS: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Operations(SetForClass):
+    find = "find"
+    aggregate = "aggregate"
+    insert = "insert"
+    update = "update"
+    delete = "delete"
+    count = "count"
+    seq_inc = "seq_inc"
+
+
+def filter_shape(filter_: Any) -> Any:
+    """filter with values replaced by type names, keys and operators are kept"""
+    if isinstance(filter_, dict):
+        return {k: filter_shape(v) for k, v in filter_.items()}
+    if isinstance(filter_, (list, tuple)):
+        if filter_ and all(isinstance(v, dict) for v in filter_):
+            return [filter_shape(v) for v in filter_]
+        return f"[{len(filter_)}]"
+    return type(filter_).__name__
+
+
+class OperationStats:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.count = 0
+        self.error_count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        # not cumulative, bucket_counts[i] is count of latencies <= buckets[i] and > previous bound
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+    def observe(self, seconds: float, is_error: bool = False):
+        self.count += 1
+        if is_error:
+            self.error_count += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        self.bucket_counts[bisect_left(self.buckets, seconds)] += 1
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "error_count": self.error_count,
+            "total_seconds": self.total_seconds,
+            "max_seconds": self.max_seconds,
+            "buckets": dict(zip([*self.buckets, float("inf")], self.bucket_counts))
+        }
+
+
+class OperationsStats:
+    """count, errors and latency histogram of db operations per (collection, operation)"""
+
+    def __init__(self, slow_threshold: Optional[float] = None):
+        self.slow_threshold = slow_threshold  # seconds, None disables slow operation log
+        self.__stats: dict[tuple[str, str], OperationStats] = {}
+
+    @contextmanager
+    def track(self, *, collection: str, operation: str, filter_: Any = None) -> Iterator[None]:
+        started = time.perf_counter()
+        is_error = False
+        try:
+            yield
+        except Exception:
+            is_error = True
+            raise
+        finally:
+            self.observe(
+                collection=collection,
+                operation=operation,
+                seconds=time.perf_counter() - started,
+                is_error=is_error,
+                filter_=filter_
+            )
+
+    def observe(self, *, collection: str, operation: str, seconds: float, is_error: bool = False, filter_: Any = None):
+        """for operations which are not timed by track, e.g. cursor iterated across awaits"""
+        key = (collection, operation)
+        stats = self.__stats.get(key)
+        if stats is None:
+            stats = self.__stats[key] = OperationStats()
+        stats.observe(seconds, is_error=is_error)
+        if self.slow_threshold is not None and seconds >= self.slow_threshold:
+            message = f"slow {operation} on '{collection}' took {seconds * 1000:.1f}ms"
+            if filter_ is not None:
+                message += f", filter shape: {filter_shape(filter_)}"
+            log.warning(message)
+
+    def snapshot(self) -> dict[str, dict[str, dict[str, Any]]]:
+        """{collection: {operation: stats}}"""
+        res: dict[str, dict[str, dict[str, Any]]] = {}
+        for (collection, operation), stats in list(self.__stats.items()):
+            res.setdefault(collection, {})[operation] = stats.to_dict()
+        return res
+
+    def items(self) -> list[tuple[tuple[str, str], OperationStats]]:
+        """[((collection, operation), stats)]"""
+        return list(self.__stats.items())
+
+    def reset(self):
+        self.__stats.clear()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    connection pool counters per server address of all clients the listener is passed to,
+    callbacks are called from pymongo threads
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__stats: dict[str, dict[str, int]] = {}
+
+    def __inc(self, address: tuple[str, int], key: str, value: int = 1):
+        address = f"{address[0]}:{address[1]}"
+        with self.__lock:
+            stats = self.__stats.get(address)
+            if stats is None:
+                stats = self.__stats[address] = {
+                    "open": 0,
+                    "checked_out": 0,
+                    "created": 0,
+                    "closed": 0,
+                    "checkout_failed": 0,
+                    "cleared": 0
+                }
+            stats[key] += value
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.__inc(event.address, "cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.__inc(event.address, "created")
+        self.__inc(event.address, "open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.__inc(event.address, "closed")
+        self.__inc(event.address, "open", -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.__inc(event.address, "checkout_failed")
+
+    def connection_checked_out(self, event):
+        self.__inc(event.address, "checked_out")
+
+    def connection_checked_in(self, event):
+        self.__inc(event.address, "checked_out", -1)
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        """{address: counters}"""
+        with self.__lock:
+            return {address: dict(stats) for address, stats in self.__stats.items()}
+
+
+operations_stats = OperationsStats()
+pool_stats = PoolStats()
@@ -1,16 +1,20 @@
 import pymongo
+from pymongo.errors import DuplicateKeyError
 
 from gold_calf.db.base import BaseCollection, BaseFields
 
 
 class UserFields(BaseFields):
-    tokens = "tokens"
+    tokens = "tokens"  # legacy, tokens are stored in session collection, see migrate_user_tokens_to_sessions
     roles = "roles"
     is_accepted = "is_accepted"
     mail = "mail"
 
 class UserCollection(BaseCollection):
     COLLECTION_NAME = "user"
+    # mail_1 did not prevent two users with same mail, replaced by unique mail index
+    LEGACY_INDEXES = ["mail_1"]
+    MAIL_INDEX_NAME = "mail_1_unique"
 
     async def ensure_indexes(self):
         await super().ensure_indexes()
@@ -18,3 +22,32 @@ class UserCollection(BaseCollection):
             [(UserFields.int_id, pymongo.ASCENDING), (UserFields.mail, pymongo.ASCENDING)],
             unique=True, sparse=True
         )
+        # one user per mail and get_user(mail=...), compound index above can't serve mail-only queries,
+        # users without mail (None) are not indexed, {$gt: ""} matches only strings
+        # and unlike {$type: "string"} it is implied by equality queries on mail
+        try:
+            await self.motor_collection.create_index(
+                [(UserFields.mail, pymongo.ASCENDING)],
+                name=self.MAIL_INDEX_NAME,
+                unique=True,
+                partialFilterExpression={UserFields.mail: {"$gt": ""}}
+            )
+        except DuplicateKeyError as e:
+            # legacy index is kept to serve queries by mail
+            self.log.error(
+                f"unique index on '{UserFields.mail}' was not created on '{self.collection_name}', "
+                f"remove duplicated users with same mail: {e}"
+            )
+        else:
+            index_information = await self.motor_collection.index_information()
+            for index_name in self.LEGACY_INDEXES:
+                if index_name in index_information:
+                    await self.motor_collection.drop_index(index_name)
+                    self.log.info(f"legacy index '{index_name}' was dropped on '{self.collection_name}'")
+        # for keyset pages of create_users_cursor
+        await self.motor_collection.create_index(
+            [(UserFields.roles, pymongo.ASCENDING), (UserFields.int_id, pymongo.ASCENDING)]
+        )
+        await self.motor_collection.create_index(
+            [(UserFields.is_accepted, pymongo.ASCENDING), (UserFields.int_id, pymongo.ASCENDING)]
+        )
@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import os
+import smtplib
+import socket
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Optional, Any
+
+from aiogram.utils.markdown import quote_html
+from bson import ObjectId
+
+from gold_calf.consts import OutboxStatuses
+from gold_calf.db.base import Document, BaseFields
+from gold_calf.db.outbox import OutboxCollection, OutboxFields
+from gold_calf.db.stats import OperationStats
+
+log = logging.getLogger(__name__)
+
+# upper bounds in seconds of enqueue to send latency, last bucket is +Inf
+SEND_LATENCY_BUCKETS: tuple[float, ...] = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+
+class MailMessage:
+    def __init__(
+            self,
+            *,
+            to_email: str,
+            subject: str,
+            text: str,
+            oid: Optional[ObjectId] = None,
+            attempts: int = 0,
+            created: Optional[datetime] = None
+    ):
+        self.to_email = to_email
+        self.subject = subject
+        self.text = text
+        self.oid = oid
+        self.attempts = attempts
+        self.created = created
+
+    @classmethod
+    def parse_document(cls, doc: Document) -> "MailMessage":
+        return cls(
+            to_email=doc[OutboxFields.to_mail],
+            subject=doc[OutboxFields.subject],
+            text=doc[OutboxFields.text],
+            oid=doc[OutboxFields.oid],
+            attempts=doc.get(OutboxFields.attempts, 0),
+            created=doc.get(OutboxFields.created)
+        )
+
+    def as_string(self, from_email: str) -> str:
+        msg = MIMEMultipart()
+        msg['From'] = from_email
+        msg['To'] = self.to_email
+        msg['Subject'] = self.subject
+        msg.attach(MIMEText(quote_html(self.text), 'plain'))
+        return msg.as_string()
+
+
+class SMTPConnection:
+    """one logged in smtp session, methods are blocking and run in worker threads"""
+    TIMEOUT = 30
+
+    def __init__(self, *, server: str, port: int, login: str, password: str, use_ssl: bool = True):
+        self.server = server
+        self.port = port
+        self.login = login
+        self.password = password
+        self.use_ssl = use_ssl
+        self.__smtp: Optional[smtplib.SMTP] = None
+
+    def connect(self):
+        self.close()
+        if self.use_ssl is True:
+            smtp = smtplib.SMTP_SSL(self.server, self.port, timeout=self.TIMEOUT)
+        else:
+            smtp = smtplib.SMTP(self.server, self.port, timeout=self.TIMEOUT)
+        smtp.ehlo()
+        if smtp.has_extn("auth"):
+            smtp.login(self.login, self.password)
+        self.__smtp = smtp
+
+    def close(self):
+        if self.__smtp is None:
+            return
+        try:
+            self.__smtp.quit()
+        except smtplib.SMTPException:
+            pass
+        except OSError:
+            pass
+        self.__smtp = None
+
+    def send(self, message: MailMessage):
+        """sends message, reconnects once if session was dropped by server"""
+        if self.__smtp is None:
+            self.connect()
+        try:
+            self.__smtp.sendmail(self.login, message.to_email, message.as_string(self.login))
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self.connect()
+            self.__smtp.sendmail(self.login, message.to_email, message.as_string(self.login))
+
+    def try_send(self, message: MailMessage) -> Optional[Exception]:
+        """returns error if message was not sent, session is closed after error"""
+        try:
+            self.send(message)
+        except Exception as e:
+            self.close()
+            return e
+        return None
+
+
+class MailOutbox:
+    """
+    mail is stored in outbox collection and sent by background workers of every api process,
+    mail is claimed with find_one_and_update so it is sent once even with several processes,
+    claim of dead worker expires after lease_seconds and mail is claimed again,
+    each worker keeps own logged in smtp session and claims mail in batches,
+    claim of each mail is renewed right before it is sent and mail is marked right after,
+    so lease_seconds must only cover sending of one mail, not of whole batch
+    """
+
+    def __init__(
+            self,
+            *,
+            collection: OutboxCollection,
+            server: str,
+            port: int,
+            login: str,
+            password: str,
+            use_ssl: bool = True,
+            workers: int = 2,
+            batch_size: int = 20,
+            max_retries: int = 5,
+            retry_backoff: float = 1.0,
+            poll_interval: float = 5.0,
+            lease_seconds: float = 120.0
+    ):
+        self.collection = collection
+        self.server = server
+        self.port = port
+        self.login = login
+        self.password = password
+        self.use_ssl = use_ssl
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.__wakeup = asyncio.Event()
+        self.__worker_tasks: list[asyncio.Task] = []
+        # seconds from enqueue to send of mail sent by this process
+        self.send_latency = OperationStats(buckets=SEND_LATENCY_BUCKETS)
+        self.sent_count = 0
+        self.failed_count = 0
+        # count of mails by status in whole outbox, updated by refresh_queue_depth
+        self.queue_depth: dict[str, int] = {status: 0 for status in sorted(OutboxStatuses.set())}
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self.__worker_tasks)
+
+    def create_connection(self) -> SMTPConnection:
+        return SMTPConnection(
+            server=self.server,
+            port=self.port,
+            login=self.login,
+            password=self.password,
+            use_ssl=self.use_ssl
+        )
+
+    @staticmethod
+    def make_document(message: MailMessage) -> Document:
+        return {
+            OutboxFields.to_mail: message.to_email,
+            OutboxFields.subject: message.subject,
+            OutboxFields.text: message.text,
+            OutboxFields.status: OutboxStatuses.pending,
+            OutboxFields.attempts: 0,
+            OutboxFields.next_attempt_at: datetime.utcnow()
+        }
+
+    async def put(self, *, to_email: str, subject: str, text: str):
+        await self.collection.insert_document(
+            self.make_document(MailMessage(to_email=to_email, subject=subject, text=text))
+        )
+        self.__wakeup.set()
+
+    async def put_many(self, messages: list[MailMessage]):
+        """stores all messages with insert_many"""
+        if not messages:
+            return
+        await self.collection.insert_documents([self.make_document(message) for message in messages])
+        self.__wakeup.set()
+
+    async def start(self):
+        if self.is_running:
+            return
+        worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(self.workers):
+            self.__worker_tasks.append(asyncio.create_task(
+                self.__work(claimed_by=f"{worker_prefix}:{i}", connection=self.create_connection())
+            ))
+        log.info(f'mail outbox was started with {self.workers} workers')
+
+    async def stop(self):
+        """stops workers, claimed but unsent mail is picked up again after lease expires"""
+        if not self.is_running:
+            return
+        for task in self.__worker_tasks:
+            task.cancel()
+        self.__worker_tasks.clear()
+        log.info('mail outbox was stopped')
+
+    async def __claim_batch(self, claimed_by: str) -> list[MailMessage]:
+        batch = []
+        while len(batch) < self.batch_size:
+            doc = await self.collection.claim_document(claimed_by=claimed_by, lease_seconds=self.lease_seconds)
+            if doc is None:
+                break
+            batch.append(MailMessage.parse_document(doc))
+        return batch
+
+    async def __work(self, *, claimed_by: str, connection: SMTPConnection):
+        try:
+            while True:
+                try:
+                    batch = await self.__claim_batch(claimed_by)
+                    if not batch:
+                        self.__wakeup.clear()
+                        try:
+                            await asyncio.wait_for(self.__wakeup.wait(), timeout=self.poll_interval)
+                        except asyncio.TimeoutError:
+                            pass
+                        continue
+                    sent_count = 0
+                    for message in batch:
+                        if await self.__send(claimed_by=claimed_by, connection=connection, message=message):
+                            sent_count += 1
+                    log.info(f'mail batch({sent_count}/{len(batch)}) was sent by {claimed_by}')
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log.exception(e)
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            await asyncio.to_thread(connection.close)
+
+    async def __send(self, *, claimed_by: str, connection: SMTPConnection, message: MailMessage) -> bool:
+        """sends claimed mail if claim was not taken by other worker, returns True if mail was sent"""
+        if not await self.collection.renew_claim(oid=message.oid, claimed_by=claimed_by):
+            log.warning(f'claim of mail to {message.to_email} was taken over, mail was not sent by {claimed_by}')
+            return False
+        e = await asyncio.to_thread(connection.try_send, message)
+        if e is None:
+            await self.__mark_sent(claimed_by=claimed_by, message=message)
+            return True
+        await self.__mark_failed(claimed_by=claimed_by, message=message, e=e)
+        return False
+
+    async def __mark_sent(self, *, claimed_by: str, message: MailMessage):
+        now = datetime.utcnow()
+        await self.collection.update_document(
+            {BaseFields.oid: message.oid, OutboxFields.claimed_by: claimed_by},
+            set_={OutboxFields.status: OutboxStatuses.sent, OutboxFields.sent_at: now},
+            unset=[OutboxFields.claimed_by, OutboxFields.claimed_at]
+        )
+        if message.created is not None:
+            self.send_latency.observe((now - message.created).total_seconds())
+        self.sent_count += 1
+
+    async def __mark_failed(self, *, claimed_by: str, message: MailMessage, e: Exception):
+        attempts = message.attempts + 1
+        set_: dict[str, Any] = {OutboxFields.attempts: attempts, OutboxFields.last_error: repr(e)}
+        if attempts > self.max_retries:
+            set_[OutboxFields.status] = OutboxStatuses.failed
+            self.failed_count += 1
+            log.error(f'mail to {message.to_email} was not sent after {attempts} attempts: {e!r}')
+        else:
+            delay = self.retry_backoff * 2 ** (attempts - 1)
+            set_[OutboxFields.status] = OutboxStatuses.pending
+            set_[OutboxFields.next_attempt_at] = datetime.utcnow() + timedelta(seconds=delay)
+            log.warning(f'mail to {message.to_email} will be retried in {delay}s: {e!r}')
+        await self.collection.update_document(
+            {BaseFields.oid: message.oid, OutboxFields.claimed_by: claimed_by},
+            set_=set_,
+            unset=[OutboxFields.claimed_by, OutboxFields.claimed_at]
+        )
+
+    async def refresh_queue_depth(self):
+        """counts mails by status of all processes with one aggregation"""
+        queue_depth = {status: 0 for status in sorted(OutboxStatuses.set())}
+        for doc in await self.collection.aggregate([
+            {"$group": {"_id": f"${OutboxFields.status}", "count": {"$sum": 1}}}
+        ]):
+            queue_depth[doc["_id"]] = doc["count"]
+        self.queue_depth = queue_depth
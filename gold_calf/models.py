@@ -2,21 +2,27 @@ from __future__ import annotations
 
 from datetime import datetime
 from ipaddress import IPv4Interface, IPv4Address
-from typing import Any, Optional
+from typing import Any, Optional, ClassVar
 
 from bson import ObjectId
 from pydantic import BaseModel, Field, Extra
 from pydantic.fields import ModelField
 
-from gold_calf.consts import RolesType
+from gold_calf.consts import RolesType, roles_to_list
 from gold_calf.db.base import BaseFields, Document
+from gold_calf.db.import_checkpoint import ImportCheckpointFields
 from gold_calf.db.mailcode import MailCodeFields
 from gold_calf.db.user import UserFields
 from gold_calf.db.request import RequestFields
-from gold_calf.utils import roles_to_list
+
+# {model class: {alias: field name}}, filled by BaseDBM.get_db_aliases
+_db_aliases: dict[type, dict[str, str]] = {}
 
 
 class BaseDBM(BaseModel):
+    # parse_document validates documents if True, set from settings.validate_db_documents in core
+    validate_documents: ClassVar[bool] = False
+
     misc_data: dict[Any, Any] = Field(default={})
 
     # db fields
@@ -52,17 +58,36 @@ class BaseDBM(BaseModel):
         return data
 
     @classmethod
-    def parse_document(cls, doc: Document) -> BaseDBM:
-        """get only fields that has alias and exists in doc"""
-        doc_to_parse = {}
-        for f in cls.__fields__.values():
-            f: ModelField
-            if f.has_alias is False:
-                continue
-            if f.alias not in doc:
-                continue
-            doc_to_parse[f.alias] = doc[f.alias]
-        return cls.parse_obj(doc_to_parse)
+    def get_db_aliases(cls) -> dict[str, str]:
+        """{alias: field name} of fields that has alias, computed once per class"""
+        db_aliases = _db_aliases.get(cls)
+        if db_aliases is None:
+            db_aliases = _db_aliases[cls] = {
+                f.alias: f.name
+                for f in cls.__fields__.values()
+                if f.has_alias is True
+            }
+        return db_aliases
+
+    @classmethod
+    def get_db_projection(cls) -> dict[str, bool]:
+        """projection of fields that has alias, skips fields which are not in model (e.g. legacy)"""
+        return {alias: True for alias in cls.get_db_aliases()}
+
+    @classmethod
+    def parse_document(cls, doc: Document, validate: Optional[bool] = None) -> BaseDBM:
+        """
+        get only fields that has alias and exists in doc, doc can be partial (read with projection),
+        missing fields get defaults and are not in __fields_set__,
+        values are typed by mongo so they are not validated unless validate (BaseDBM.validate_documents by default)
+        """
+        db_aliases = cls.get_db_aliases()
+        if validate is None:
+            validate = BaseDBM.validate_documents
+        if validate is True:
+            return cls.parse_obj({alias: doc[alias] for alias in db_aliases if alias in doc})
+        values = {name: doc[alias] for alias, name in db_aliases.items() if alias in doc}
+        return cls.construct(_fields_set=set(values), **values)
 
     def document(self) -> Document:
         doc = self.dict(by_alias=True, exclude_none=False, exclude_unset=False, exclude_defaults=False)
@@ -84,7 +109,6 @@ class BaseDBM(BaseModel):
 
 class User(BaseDBM):
     # db fields
-    tokens: list[str] = Field(alias=UserFields.tokens, default=[])
     roles: list[str] = Field(alias=UserFields.roles, default=[])
     is_accepted: Optional[bool] = Field(alias=UserFields.is_accepted)
     mail: Optional[str] = Field(alias=UserFields.mail)
@@ -109,6 +133,8 @@ class Request(BaseDBM):
     job_title: Optional[str] = Field(alias=RequestFields.job_title)
     is_accepted: Optional[bool] = Field(alias=RequestFields.is_accepted)
     user_id: Optional[int] = Field(alias=RequestFields.user_id)
+    claimed_by: Optional[int] = Field(alias=RequestFields.claimed_by)
+    claim_expires_at: Optional[datetime] = Field(alias=RequestFields.claim_expires_at)
 
 
 
@@ -121,3 +147,12 @@ class MailCode(BaseDBM):
 
     # direct linked models
     to_user: Optional[User] = Field(default=None)
+
+
+class ImportCheckpoint(BaseDBM):
+    # db fields
+    filepath: str = Field(alias=ImportCheckpointFields.filepath)
+    content_hash: str = Field(alias=ImportCheckpointFields.content_hash)
+    last_row: int = Field(alias=ImportCheckpointFields.last_row, default=0)
+    is_finished: bool = Field(alias=ImportCheckpointFields.is_finished, default=False)
+    updated: Optional[datetime] = Field(alias=ImportCheckpointFields.updated)
@@ -0,0 +1,275 @@
+"""
+query shapes used by services with sample values, filters and sorts are built by same helpers as in services,
+check_query_shapes runs explain() on each of them and reports shapes which are not served by index (COLLSCAN),
+sorted shapes with in-memory SORT or covered shapes which fetch documents, run it with run_explain.py
+"""
+import logging
+from datetime import datetime
+from typing import Any, Optional
+
+from bson import ObjectId
+
+from gold_calf import services
+from gold_calf.consts import MailCodeTypes
+from gold_calf.db.base import BaseCollection, Filter, Sort, Projection
+from gold_calf.db.db import DB
+from gold_calf.db.outbox import OutboxCollection
+from gold_calf.db.user import UserFields
+
+log = logging.getLogger(__name__)
+
+
+class QueryShape:
+    def __init__(
+            self,
+            *,
+            name: str,
+            collection: str,
+            filter_: Filter,
+            sort_: Optional[Sort] = None,
+            projection: Optional[Projection] = None,
+            is_covered: bool = False,
+            allow_blocking_sort: bool = False
+    ):
+        self.name = name
+        self.collection = collection  # attribute of DB
+        self.filter_ = filter_
+        self.sort_ = sort_
+        self.projection = projection
+        self.is_covered = is_covered  # must be index-only (no FETCH)
+        self.allow_blocking_sort = allow_blocking_sort  # in-memory SORT is expected
+
+
+QUERY_SHAPES: list[QueryShape] = []
+
+
+def register_query_shape(
+        *,
+        name: str,
+        collection: str,
+        filter_: Filter,
+        sort_: Optional[Sort] = None,
+        projection: Optional[Projection] = None,
+        is_covered: bool = False,
+        allow_blocking_sort: bool = False
+):
+    QUERY_SHAPES.append(QueryShape(
+        name=name,
+        collection=collection,
+        filter_=filter_,
+        sort_=sort_,
+        projection=projection,
+        is_covered=is_covered,
+        allow_blocking_sort=allow_blocking_sort
+    ))
+
+
+_now = datetime.utcnow()
+
+# user
+register_query_shape(
+    name="get_user(id_=oid)", collection="user_collection", filter_=services.make_user_filter(id_=ObjectId())
+)
+register_query_shape(name="get_user(id_=int_id)", collection="user_collection", filter_=services.make_user_filter(id_=1))
+register_query_shape(
+    name="get_user(mail=...)", collection="user_collection", filter_=services.make_user_filter(mail="a@b.c")
+)
+register_query_shape(
+    name="user_with_mail_exists",
+    collection="user_collection",
+    filter_=services.make_user_filter(mail="a@b.c"),
+    projection=BaseCollection.make_covered_projection(services.USER_MAIL_INDEX_FIELDS),
+    is_covered=True
+)
+register_query_shape(
+    name="upsert_users(existing)",
+    collection="user_collection",
+    filter_=BaseCollection.make_keys_filter(
+        [{UserFields.mail: "a@b.c"}, {UserFields.mail: "d@e.f"}], services.USER_UPSERT_KEY_FIELDS
+    ),
+    projection=BaseCollection.make_covered_projection(services.USER_UPSERT_KEY_FIELDS)
+)
+register_query_shape(
+    name="upsert_users",
+    collection="user_collection",
+    filter_=BaseCollection.make_key_filter({UserFields.mail: "a@b.c"}, services.USER_UPSERT_KEY_FIELDS)
+)
+register_query_shape(
+    name="get_users_by_mails",
+    collection="user_collection",
+    filter_=services.make_users_by_mails_filter(mails=["a@b.c", "d@e.f"])
+)
+for _kwargs in [
+    {},
+    {"after_int_id": 1},
+    {"roles": ["hr"]},
+    {"roles": ["hr"], "after_int_id": 1},
+    {"is_accepted": True},
+    {"is_accepted": True, "after_int_id": 1}
+]:
+    register_query_shape(
+        name=f"create_users_cursor({', '.join(_kwargs)})",
+        collection="user_collection",
+        filter_=services.make_users_filter(**_kwargs),
+        sort_=services.USERS_SORT
+    )
+
+# session
+register_query_shape(
+    name="get_user(token=...)", collection="session_collection", filter_=services.make_session_filter(token="0")
+)
+register_query_shape(
+    name="remove_token",
+    collection="session_collection",
+    filter_=services.make_session_filter(token="0", user_oid=ObjectId())
+)
+
+# request
+register_query_shape(
+    name="get_request(int_id=...)", collection="request_collection", filter_=services.make_request_filter(int_id=1)
+)
+register_query_shape(
+    name="get_request(user_id=...), update_request",
+    collection="request_collection",
+    filter_=services.make_request_filter(user_id=1)
+)
+register_query_shape(
+    name="user_request_exists",
+    collection="request_collection",
+    filter_=services.make_request_filter(user_id=1),
+    projection=BaseCollection.make_covered_projection(services.REQUEST_USER_ID_INDEX_FIELDS),
+    is_covered=True
+)
+register_query_shape(
+    name="upsert_requests(existing)",
+    collection="request_collection",
+    filter_=BaseCollection.make_keys_filter(
+        [
+            services.make_request_document(mail="a@b.c", user_id=1),
+            services.make_request_document(mail="d@e.f", user_id=2)
+        ],
+        services.REQUEST_UPSERT_KEY_FIELDS
+    ),
+    projection=BaseCollection.make_covered_projection(services.REQUEST_UPSERT_KEY_FIELDS)
+)
+register_query_shape(
+    name="upsert_requests",
+    collection="request_collection",
+    filter_=BaseCollection.make_key_filter(
+        services.make_request_document(mail="a@b.c", user_id=1), services.REQUEST_UPSERT_KEY_FIELDS
+    )
+)
+register_query_shape(
+    name="claim_next_request(expired)",
+    collection="request_collection",
+    filter_=services.make_expired_claims_filter(now=_now),
+    sort_=services.EXPIRED_CLAIMS_SORT
+)
+register_query_shape(
+    name="claim_next_request(unclaimed)",
+    collection="request_collection",
+    filter_=services.make_unclaimed_requests_filter(),
+    sort_=services.UNCLAIMED_REQUESTS_SORT
+)
+for _kwargs in [
+    {},
+    {"after_int_id": 1},
+    {"is_accepted": False, "after_int_id": 1},
+    {"job_title": "Data Analyst", "after_int_id": 1},
+    {"experience_level": "SE", "after_int_id": 1}
+]:
+    register_query_shape(
+        name=f"create_requests_cursor({', '.join(_kwargs)})",
+        collection="request_collection",
+        filter_=services.make_requests_filter(**_kwargs),
+        sort_=services.REQUESTS_SORT
+    )
+register_query_shape(
+    name="process_requests(own), proccess_request",
+    collection="request_collection",
+    filter_=services.make_processable_requests_filter(int_ids=[1, 2], now=_now)
+)
+register_query_shape(
+    name="process_requests(owned)",
+    collection="request_collection",
+    filter_=services.make_processing_requests_filter(processing_by=ObjectId())
+)
+register_query_shape(
+    name="process_requests(users)",
+    collection="user_collection",
+    filter_=services.make_users_by_int_ids_filter(int_ids=[1, 2])
+)
+
+# mail code
+register_query_shape(
+    name="consume_mail_code",
+    collection="mail_code_collection",
+    filter_=services.make_consumable_mail_code_filter(
+        to_mail="a@b.c", code="1111", type_=MailCodeTypes.auth, now=_now
+    ),
+    sort_=services.MAIL_CODES_SORT
+)
+
+# outbox
+register_query_shape(
+    name="MailOutbox claim",
+    collection="outbox_collection",
+    filter_=OutboxCollection.make_claimable_filter(now=_now, lease_seconds=120),
+    sort_=OutboxCollection.CLAIM_SORT,
+    # branches of $or use different indexes, only due mail is sorted
+    allow_blocking_sort=True
+)
+
+# import checkpoint
+register_query_shape(
+    name="get_or_create_import_checkpoint",
+    collection="import_checkpoint_collection",
+    filter_=services.make_import_checkpoint_filter(filepath="/a.csv", content_hash="0" * 64)
+)
+
+
+def get_plan_stages(plan: Any) -> list[str]:
+    """all stage names of explain() output"""
+    stages = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.append(plan["stage"])
+        for v in plan.values():
+            stages += get_plan_stages(v)
+    elif isinstance(plan, list):
+        for v in plan:
+            stages += get_plan_stages(v)
+    return stages
+
+
+async def explain_query_shape(db: DB, query_shape: QueryShape) -> list[str]:
+    collection: BaseCollection = getattr(db, query_shape.collection)
+    cursor = collection.create_cursor(
+        filter_=query_shape.filter_, sort_=query_shape.sort_, projection=query_shape.projection, limit=1
+    )
+    explain = await cursor.explain()
+    return get_plan_stages(explain["queryPlanner"]["winningPlan"])
+
+
+def is_bad_plan(query_shape: QueryShape, stages: list[str]) -> bool:
+    if "COLLSCAN" in stages:
+        return True
+    if query_shape.sort_ and not query_shape.allow_blocking_sort and "SORT" in stages:
+        return True
+    return query_shape.is_covered and "FETCH" in stages
+
+
+async def check_query_shapes(db: DB) -> list[QueryShape]:
+    """
+    logs winning plan of every registered query shape,
+    returns shapes with COLLSCAN, in-memory SORT or not covered
+    """
+    bad_query_shapes = []
+    for query_shape in QUERY_SHAPES:
+        stages = await explain_query_shape(db, query_shape)
+        if is_bad_plan(query_shape, stages):
+            bad_query_shapes.append(query_shape)
+            log.error(f"{query_shape.name} on '{query_shape.collection}': {' <- '.join(stages)}")
+        else:
+            log.info(f"{query_shape.name} on '{query_shape.collection}': {' <- '.join(stages)}")
+    return bad_query_shapes
@@ -4,20 +4,29 @@ from random import randint
 from typing import Union, Optional
 from statistics import mean, median
 import binascii
+import hashlib
+import time
+from datetime import datetime, timedelta
 
 import pymongo
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 
-from gold_calf.consts import UserRoles, RolesType
-from gold_calf.core import db
-from gold_calf.db.base import Id
+from gold_calf.consts import UserRoles, RolesType, ProcessRequestResults, roles_to_list
+from gold_calf.core import db, token_cache, settings, revocations
+from gold_calf.db.base import Id, BaseFields, Document, Projection, TrackedCursor, Filter, Sort
+from gold_calf.db.import_checkpoint import ImportCheckpointFields
 from gold_calf.db.mailcode import MailCodeFields
 from gold_calf.db.user import UserFields
 from gold_calf.db.request import RequestFields
+from gold_calf.db.revocation import RevocationFields
+from gold_calf.db.session import SessionFields
 from gold_calf.helpers import NotSet, is_set
-from gold_calf.models import User, MailCode, Request
-from gold_calf.utils import roles_to_list
-from gold_calf.utils import send_mail
+from gold_calf.mail_outbox import MailMessage
+from gold_calf.models import User, MailCode, Request, ImportCheckpoint
+from gold_calf.signed_token import sign_token, verify_token, is_signed_token
+from gold_calf.utils import send_mail, send_mails
 
 log = logging.getLogger()
 
@@ -29,15 +38,203 @@ def generate_token() -> str:
     res = binascii.hexlify(os.urandom(20)).decode() + str(randint(10000, 1000000))
     return res[:128]
 
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def make_session_filter(*, token: str, user_oid: Optional[ObjectId] = None) -> Filter:
+    filter_ = {SessionFields.token_hash: hash_token(token)}
+    if user_oid is not None:
+        filter_[SessionFields.user_oid] = user_oid
+    return filter_
+
+
+async def create_session(*, user_oid: ObjectId, token: Optional[str] = None) -> str:
+    if token is None:
+        token = generate_token()
+    await db.session_collection.insert_document({
+        SessionFields.token_hash: hash_token(token),
+        SessionFields.user_oid: user_oid
+    })
+    return token
+
+
 async def remove_token(*, client_id: Id, token: str):
-    await db.user_collection.motor_collection.update_one(
-        db.user_collection.create_id_filter(id_=client_id),
-        {'$pull': {UserFields.tokens: token}}
-    )
+    if settings.signed_tokens is True and is_signed_token(token):
+        await revoke_signed_token(token=token)
+        return
+
+    user_filter = db.user_collection.create_id_filter(id_=client_id)
+    if BaseFields.oid in user_filter:
+        user_oid = user_filter[BaseFields.oid]
+    else:
+        user_doc = await db.user_collection.find_document(filter_=user_filter, projection=[BaseFields.oid])
+        if user_doc is None:
+            return
+        user_oid = user_doc[BaseFields.oid]
+
+    await db.session_collection.remove_document(make_session_filter(token=token, user_oid=user_oid))
+    invalidate_token_cache(token=token)
+
+
+async def migrate_user_tokens_to_sessions() -> int:
+    """one-shot migration of legacy user.tokens arrays to session collection, returns count of moved tokens"""
+    c = 0
+    cursor = db.user_collection.create_cursor(filter_={UserFields.tokens: {"$exists": True}})
+    async for user_doc in cursor:
+        for token in user_doc[UserFields.tokens] or []:
+            try:
+                await create_session(user_oid=user_doc[BaseFields.oid], token=token)
+            except DuplicateKeyError:
+                pass
+            c += 1
+        await db.user_collection.motor_collection.update_one(
+            {BaseFields.oid: user_doc[BaseFields.oid]},
+            {"$unset": {UserFields.tokens: ""}}
+        )
+    log.info(f"tokens({c}) were migrated to sessions")
+    return c
+
+
+def invalidate_token_cache(
+        *,
+        token: Optional[str] = None,
+        user_oid: Optional[ObjectId] = None,
+        user_oids: Optional[list[ObjectId]] = None
+):
+    """cached tokens of users are removed by oid index of token_cache, without scan of cache"""
+    if token is not None:
+        token_cache.pop(token)
+    if user_oid is not None:
+        token_cache.remove_by_index([user_oid])
+    if user_oids is not None:
+        token_cache.remove_by_index(user_oids)
+
+
+async def get_user_by_token(token: str) -> Optional[User]:
+    """same as get_user(token=...) but served from in-process ttl cache when possible"""
+    user: Optional[User] = token_cache.get(token)
+    if user is None:
+        user = await get_user(token=token)
+        if user is None:
+            return None
+        token_cache.set(token, user)
+    return user.copy(deep=True)
+
+
+async def issue_token(*, user: User) -> str:
+    """signed token if settings.signed_tokens else new session token"""
+    if settings.signed_tokens is True:
+        return sign_token(
+            claims={"oid": str(user.oid), "int_id": user.int_id, "roles": user.roles},
+            secret=_get_signed_tokens_secret(),
+            ttl=settings.signed_tokens_ttl
+        )
+    return await create_session(user_oid=user.oid)
+
+
+"""SIGNED TOKEN LOGIC"""
+
+
+def _get_signed_tokens_secret() -> str:
+    if settings.signed_tokens_secret is None:
+        raise ValueError("settings.signed_tokens_secret is None")
+    return settings.signed_tokens_secret
+
+
+def get_user_by_signed_token(token: str) -> Optional[User]:
+    """
+    builds user from token claims without db access,
+    user has only oid, int_id and roles and misc_data["from_claims"] is True
+    """
+    claims = verify_token(token=token, secret=_get_signed_tokens_secret())
+    if claims is None or revocations.is_revoked(claims):
+        return None
+    user = User(oid=ObjectId(claims["oid"]), int_id=claims["int_id"], roles=claims["roles"])
+    user.misc_data["from_claims"] = True
+    return user
+
+
+async def revoke_signed_token(*, token: str):
+    claims = verify_token(token=token, secret=_get_signed_tokens_secret())
+    if claims is None:
+        return
+    revocations.revoke_jti(claims["jti"])
+    await db.revocation_collection.insert_document({
+        RevocationFields.jti: claims["jti"],
+        RevocationFields.expires_at: datetime.utcfromtimestamp(claims["exp"])
+    })
+
+
+async def revoke_user_signed_tokens(*, user_oid: ObjectId):
+    """revokes all signed tokens of user issued before now"""
+    if settings.signed_tokens is not True:
+        return
+    now = time.time()
+    revocations.revoke_user(str(user_oid), now)
+    await db.revocation_collection.insert_document({
+        RevocationFields.user_oid: user_oid,
+        RevocationFields.revoked_before: now,
+        RevocationFields.expires_at: datetime.utcfromtimestamp(now + settings.signed_tokens_ttl)
+    })
+
+
+async def refresh_revocations():
+    jtis: set[str] = set()
+    users_revoked_before: dict[str, float] = {}
+    async for doc in db.revocation_collection.create_cursor():
+        if doc.get(RevocationFields.jti) is not None:
+            jtis.add(doc[RevocationFields.jti])
+        if doc.get(RevocationFields.user_oid) is not None:
+            user_oid = str(doc[RevocationFields.user_oid])
+            users_revoked_before[user_oid] = max(
+                users_revoked_before.get(user_oid, 0), doc[RevocationFields.revoked_before]
+            )
+    revocations.replace(jtis=jtis, users_revoked_before=users_revoked_before)
 
 
 """USER LOGIC"""
 
+USERS_SORT: Sort = [(UserFields.int_id, pymongo.ASCENDING)]
+USER_UPSERT_KEY_FIELDS = [UserFields.mail]
+USER_MAIL_INDEX_FIELDS = [UserFields.mail]
+
+
+def make_user_filter(*, id_: Optional[Id] = None, mail: Optional[str] = None, int_id: Optional[int] = None) -> Filter:
+    filter_ = {}
+    if id_ is not None:
+        filter_.update(db.user_collection.create_id_filter(id_=id_))
+    if int_id is not None:
+        filter_[UserFields.int_id] = int_id
+    if mail is not None:
+        filter_[UserFields.mail] = mail
+    return filter_
+
+
+def make_users_filter(
+        *,
+        roles: Optional[RolesType] = None,
+        is_accepted: Optional[bool] = None,
+        after_int_id: Optional[int] = None
+) -> Filter:
+    filter_ = {}
+    if roles is not None:
+        filter_[UserFields.roles] = {"$in": roles_to_list(roles)}
+    if is_accepted is not None:
+        filter_[UserFields.is_accepted] = is_accepted
+    if after_int_id is not None:
+        filter_[UserFields.int_id] = {"$gt": after_int_id}
+    return filter_
+
+
+def make_users_by_mails_filter(*, mails: list[str]) -> Filter:
+    return {UserFields.mail: {"$in": mails}}
+
+
+def make_users_by_int_ids_filter(*, int_ids: list[int]) -> Filter:
+    return {UserFields.int_id: {"$in": int_ids}}
+
+
 async def create_user(
         *,
         mail: Optional[str] = None,
@@ -59,45 +256,49 @@ async def create_user(
 
     doc_to_insert = {
         UserFields.mail: mail,
-        UserFields.tokens: tokens,
         UserFields.roles: roles,
         UserFields.is_accepted: False
     }
     inserted_doc = await db.user_collection.insert_document(doc_to_insert)
     created_user = User.parse_document(inserted_doc)
+    for token in tokens:
+        await create_session(user_oid=created_user.oid, token=token)
     created_user.misc_data["created_token"] = created_token
     return created_user
 
 async def update_user(
         *,
-        user: Union[User, ObjectId],
-        is_accepted: Union[NotSet, Optional[bool]] = NotSet
-) -> User:
+        user: Union[User, Id],
+        is_accepted: Union[NotSet, Optional[bool]] = NotSet,
+        roles: Union[NotSet, list[str]] = NotSet
+) -> Optional[User]:
+    """updates user in one round trip and returns updated user, None if user not exists"""
     if isinstance(user, User):
-        pass
-    elif isinstance(user, ObjectId):
-        user = await get_user(id_=user)
+        id_ = user.oid
+    elif isinstance(user, (int, str, ObjectId)):
+        id_ = user
     else:
         raise TypeError("bad type for user")
 
-    if user is None:
-        raise ValueError("user is None")
-
     set_ = {}
     if is_set(is_accepted):
         set_[UserFields.is_accepted] = is_accepted
+    if is_set(roles):
+        set_[UserFields.roles] = roles
 
+    if not set_:
+        if isinstance(user, User):
+            return user
+        return await get_user(id_=id_)
 
-    if set_:
-        await db.user_collection.update_document_by_id(
-            id_=user.oid,
-            set_=set_
-        )
-
-        if is_set(is_accepted):
-            user.is_accepted = is_accepted
-
-    return user
+    doc = await db.user_collection.find_and_update_document_by_id(
+        id_=id_, set_=set_, projection=User.get_db_projection()
+    )
+    if doc is None:
+        return None
+    updated_user = User.parse_document(doc)
+    invalidate_token_cache(user_oid=updated_user.oid)
+    return updated_user
 
 async def get_user(
         *,
@@ -105,47 +306,169 @@ async def get_user(
         mail: Optional[str] = None,
         int_id: Optional[int] = None,
         token: Optional[str] = None,
+        projection: Optional[Projection] = None
 ) -> Optional[User]:
-    filter_ = {}
-    if id_ is not None:
-        filter_.update(db.user_collection.create_id_filter(id_=id_))
-    if int_id is not None:
-        filter_[UserFields.int_id] = int_id
-    if mail is not None:
-        filter_[UserFields.mail] = mail
+    """projection is all fields of User by default"""
+    filter_ = make_user_filter(id_=id_, mail=mail, int_id=int_id)
     if token is not None:
-        filter_[UserFields.tokens] = {"$in": [token]}
+        session_doc = await db.session_collection.find_document(
+            filter_=make_session_filter(token=token),
+            projection={SessionFields.user_oid: True}
+        )
+        if session_doc is None:
+            return None
+        if BaseFields.oid in filter_ and filter_[BaseFields.oid] != session_doc[SessionFields.user_oid]:
+            return None
+        filter_[BaseFields.oid] = session_doc[SessionFields.user_oid]
 
     if not filter_:
         raise ValueError("not filter_")
 
-    doc = await db.user_collection.find_document(filter_=filter_)
+    if projection is None:
+        projection = User.get_db_projection()
+    doc = await db.user_collection.find_document(filter_=filter_, projection=projection)
     if doc is None:
         return None
     return User.parse_document(doc)
 
-async def get_users(*, roles: Optional[list[str]] = None) -> list[User]:
-    users = [User.parse_document(doc) async for doc in db.user_collection.create_cursor()]
-    if roles is not None:
-        users = [user for user in users if user.compare_roles(roles)]
-    return users
+async def user_with_mail_exists(*, mail: str) -> bool:
+    """index-only query on mail index"""
+    return await db.user_collection.find_covered_document(
+        filter_=make_user_filter(mail=mail), index_fields=USER_MAIL_INDEX_FIELDS
+    ) is not None
+
+async def upsert_users(*, mails: list[str], roles: RolesType = None) -> int:
+    """creates users without tokens for mails which have no user, returns count of created"""
+    if roles is None:
+        roles = [UserRoles.trainee]
+    else:
+        roles = roles_to_list(roles)
+
+    docs_to_upsert = [
+        {
+            UserFields.mail: mail,
+            UserFields.roles: list(roles),
+            UserFields.is_accepted: False
+        }
+        for mail in mails
+    ]
+    return await db.user_collection.upsert_documents(docs_to_upsert, key_fields=USER_UPSERT_KEY_FIELDS)
+
+async def get_users_by_mails(*, mails: list[str]) -> dict[str, User]:
+    cursor = db.user_collection.create_cursor(
+        filter_=make_users_by_mails_filter(mails=mails),
+        projection=User.get_db_projection()
+    )
+    return {doc[UserFields.mail]: User.parse_document(doc) async for doc in cursor}
+
+def create_users_cursor(
+        *,
+        roles: Optional[RolesType] = None,
+        is_accepted: Optional[bool] = None,
+        after_int_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        projection: Optional[Projection] = None
+) -> TrackedCursor:
+    """
+    users with any of roles ordered by int_id, use int_id of last user as after_int_id for next page,
+    projection is all fields of User by default
+    """
+    return db.user_collection.create_cursor(
+        filter_=make_users_filter(roles=roles, is_accepted=is_accepted, after_int_id=after_int_id),
+        sort_=USERS_SORT,
+        limit=limit,
+        batch_size=batch_size,
+        projection=User.get_db_projection() if projection is None else projection
+    )
 
 
 """REQUEST LOGIC"""
 
+REQUESTS_SORT: Sort = [(RequestFields.int_id, pymongo.ASCENDING)]
+REQUEST_UPSERT_KEY_FIELDS = [RequestFields.user_id]
+REQUEST_USER_ID_INDEX_FIELDS = [RequestFields.user_id]
+EXPIRED_CLAIMS_SORT: Sort = [(RequestFields.claim_expires_at, pymongo.ASCENDING)]
+UNCLAIMED_REQUESTS_SORT: Sort = [(RequestFields.created, pymongo.ASCENDING)]
+# requests owned by process_requests call which crashed are processable again after this time
+REQUEST_PROCESSING_LEASE_SECONDS = 60
 
-async def create_request(
+
+def make_request_filter(
+        *,
+        id_: Optional[Id] = None,
+        int_id: Optional[int] = None,
+        mail: Optional[str] = None,
+        user_id: Optional[int] = None
+) -> Filter:
+    filter_ = {}
+    if id_ is not None:
+        filter_.update(db.request_collection.create_id_filter(id_=id_))
+    if int_id is not None:
+        filter_[RequestFields.int_id] = int_id
+    if mail is not None:
+        filter_[RequestFields.mail] = mail
+    if user_id is not None:
+        filter_[RequestFields.user_id] = user_id
+    return filter_
+
+
+def make_requests_filter(
+        *,
+        is_accepted: Optional[bool] = None,
+        job_title: Optional[str] = None,
+        experience_level: Optional[str] = None,
+        after_int_id: Optional[int] = None
+) -> Filter:
+    filter_ = {}
+    if is_accepted is not None:
+        filter_[RequestFields.is_accepted] = is_accepted
+    if job_title is not None:
+        filter_[RequestFields.job_title] = job_title.strip()
+    if experience_level is not None:
+        filter_[RequestFields.experience_level] = experience_level.strip()
+    if after_int_id is not None:
+        filter_[RequestFields.int_id] = {"$gt": after_int_id}
+    return filter_
+
+
+def make_expired_claims_filter(*, now: datetime) -> Filter:
+    return {RequestFields.claim_expires_at: {"$lt": now}}
+
+
+def make_unclaimed_requests_filter() -> Filter:
+    return {RequestFields.claimed_by: None}
+
+
+def make_processable_requests_filter(*, int_ids: list[int], now: datetime) -> Filter:
+    """requests which are not owned by other process_requests call"""
+    return {
+        RequestFields.int_id: {"$in": int_ids},
+        "$or": [
+            {RequestFields.processing_by: None},
+            {RequestFields.processing_expires_at: {"$lt": now}}
+        ]
+    }
+
+
+def make_processing_requests_filter(*, processing_by: ObjectId, int_ids: Optional[list[int]] = None) -> Filter:
+    filter_ = {RequestFields.processing_by: processing_by}
+    if int_ids is not None:
+        filter_[RequestFields.int_id] = {"$in": int_ids}
+    return filter_
+
+
+def make_request_document(
         *,
         mail: str,
-        tokens: Optional[list[str]] = None,
         salary: Optional[int] = None,
         remote_radio: Optional[str] = None,
         work_year: Optional[int] = None,
         experience_level: Optional[str] = None,
         employment_type: Optional[str] = None,
-        job_title: Optional[str] = None,    
-        user_id: Optional[str] = None,    
-):
+        job_title: Optional[str] = None,
+        user_id: Optional[int] = None,
+) -> Document:
     mail = mail.strip()
 
     if remote_radio is not None:
@@ -160,7 +483,7 @@ async def create_request(
     if job_title is not None:
         job_title = job_title.strip()
 
-    doc_to_insert = {
+    return {
         RequestFields.mail: mail,
         RequestFields.salary: salary,
         RequestFields.remote_radio: remote_radio,
@@ -171,35 +494,68 @@ async def create_request(
         RequestFields.is_accepted: False,
         RequestFields.user_id: user_id,
     }
+
+async def create_request(
+        *,
+        mail: str,
+        tokens: Optional[list[str]] = None,
+        salary: Optional[int] = None,
+        remote_radio: Optional[str] = None,
+        work_year: Optional[int] = None,
+        experience_level: Optional[str] = None,
+        employment_type: Optional[str] = None,
+        job_title: Optional[str] = None,    
+        user_id: Optional[int] = None,
+) -> Request:
+    """raises DuplicateKeyError if user already has request (unique user_id)"""
+    doc_to_insert = make_request_document(
+        mail=mail,
+        salary=salary,
+        remote_radio=remote_radio,
+        work_year=work_year,
+        experience_level=experience_level,
+        employment_type=employment_type,
+        job_title=job_title,
+        user_id=user_id
+    )
     inserted_doc = await db.request_collection.insert_document(doc_to_insert)
-    created_request = User.parse_document(inserted_doc)
+    created_request = Request.parse_document(inserted_doc)
     return created_request
 
+async def upsert_requests(*, documents: list[Document]) -> int:
+    """
+    creates requests made by make_request_document for users which have no request,
+    returns count of created
+    """
+    return await db.request_collection.upsert_documents(documents, key_fields=REQUEST_UPSERT_KEY_FIELDS)
+
 async def get_request(
         *,
         id_: Optional[Id] = None,
         int_id: Optional[int] = None,
         mail: Optional[str] = None,
         user_id: Optional[int] = None,
+        projection: Optional[Projection] = None
 ) -> Optional[Request]:
-    filter_ = {}
-    if id_ is not None:
-        filter_.update(db.user_collection.create_id_filter(id_=id_))
-    if int_id is not None:
-        filter_[RequestFields.int_id] = int_id
-    if mail is not None:
-        filter_[RequestFields.mail] = mail
-    if user_id is not None:
-        filter_[RequestFields.user_id] = user_id
+    """projection is all fields of Request by default"""
+    filter_ = make_request_filter(id_=id_, int_id=int_id, mail=mail, user_id=user_id)
 
     if not filter_:
         raise ValueError("not filter_")
 
-    doc = await db.request_collection.find_document(filter_=filter_)
+    if projection is None:
+        projection = Request.get_db_projection()
+    doc = await db.request_collection.find_document(filter_=filter_, projection=projection)
     if doc is None:
         return None
     return Request.parse_document(doc)
 
+async def user_request_exists(*, user_id: int) -> bool:
+    """index-only query on unique user_id index"""
+    return await db.request_collection.find_covered_document(
+        filter_=make_request_filter(user_id=user_id), index_fields=REQUEST_USER_ID_INDEX_FIELDS
+    ) is not None
+
 async def update_request(
         *,
         user: Union[User, ObjectId],
@@ -210,7 +566,8 @@ async def update_request(
         experience_level: Union[NotSet, Optional[str]] = NotSet,
         employment_type: Union[NotSet, Optional[str]] = NotSet,
         job_title: Union[NotSet, Optional[str]] = NotSet,
-):
+) -> Optional[Request]:
+    """updates request of user in one round trip and returns updated request, None if request not exists"""
     if isinstance(user, User):
         pass
     elif isinstance(user, ObjectId):
@@ -248,24 +605,83 @@ async def update_request(
         set_[RequestFields.mail] = mail
 
 
-    if set_:
-        request = await get_request(user_id=user.int_id)
-        await db.request_collection.update_document_by_id(
-            id_=request.oid,
-            set_=set_
+    if not set_:
+        return await get_request(user_id=user.int_id)
+
+    doc = await db.request_collection.find_and_update_document(
+        filter_=make_request_filter(user_id=user.int_id),
+        set_=set_,
+        projection=Request.get_db_projection()
+    )
+    if doc is None:
+        return None
+    return Request.parse_document(doc)
+
+async def claim_next_request(*, user: User, lease_seconds: Optional[float] = None) -> Optional[Request]:
+    """
+    atomically assigns request to reviewer user till lease expires and returns it, None if nothing to claim,
+    requests with expired claims go first (they are waiting longest), then oldest unclaimed
+    """
+    if lease_seconds is None:
+        lease_seconds = settings.request_claim_lease_seconds
+    now = datetime.utcnow()
+    set_ = {
+        RequestFields.claimed_by: user.int_id,
+        RequestFields.claim_expires_at: now + timedelta(seconds=lease_seconds)
+    }
+    doc = await db.request_collection.find_and_update_document(
+        filter_=make_expired_claims_filter(now=now),
+        set_=set_,
+        sort_=EXPIRED_CLAIMS_SORT
+    )
+    if doc is None:
+        doc = await db.request_collection.find_and_update_document(
+            filter_=make_unclaimed_requests_filter(),
+            set_=set_,
+            sort_=UNCLAIMED_REQUESTS_SORT
         )
+    if doc is None:
+        return None
+    return Request.parse_document(doc)
 
-async def get_requests(*, roles: Optional[list[str]] = None) -> list[User]:
-    requests = [Request.parse_document(doc) async for doc in db.request_collection.create_cursor()]
-    if roles is not None:
-        requests = [user for user in requests if user.compare_roles(roles)]
-    return requests
+def create_requests_cursor(
+        *,
+        is_accepted: Optional[bool] = None,
+        job_title: Optional[str] = None,
+        experience_level: Optional[str] = None,
+        after_int_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        projection: Optional[Projection] = None
+) -> TrackedCursor:
+    """
+    requests ordered by int_id, use int_id of last request as after_int_id for next page,
+    projection is all fields of Request by default
+    """
+    return db.request_collection.create_cursor(
+        filter_=make_requests_filter(
+            is_accepted=is_accepted, job_title=job_title, experience_level=experience_level, after_int_id=after_int_id
+        ),
+        sort_=REQUESTS_SORT,
+        limit=limit,
+        batch_size=batch_size,
+        projection=Request.get_db_projection() if projection is None else projection
+    )
 
 async def remove_request(*, user_id: int):
     request = await get_request(user_id=user_id)
     if request is not None:
             await db.request_collection.remove_by_int_id(int_id=request.int_id)
 
+REQUEST_ANSWER_SUBJECT = "Ответ на заявку"
+
+
+def make_request_answer_text(*, is_accepted: bool) -> str:
+    if is_accepted:
+        return "Вы были приглашены на собеседование, позвоните по этому номеру: 224!"
+    return "К сожалению ваши навыки нам не подходят!"
+
+
 async def proccess_request(
         *,
         user: Union[User, ObjectId],
@@ -290,25 +706,141 @@ async def proccess_request(
         set_[UserFields.is_accepted] = is_accepted
 
     if set_:
-        request = await get_request(int_id=request_id)
-        worker = await get_user(int_id=request.user_id)
-        await db.user_collection.update_document_by_int_id(
-            int_id=request.user_id,
-            set_=set_
+        # request is removed first, so only one of concurrent calls for it updates user and sends mail
+        request_doc = await db.request_collection.find_and_remove_document(
+            filter_=make_processable_requests_filter(int_ids=[request_id], now=datetime.utcnow()),
+            projection=[RequestFields.user_id]
         )
-        await db.request_collection.remove_by_int_id(int_id=request_id)
-        if is_accepted:
-            answer = "Вы были приглашены на собеседование, позвоните по этому номеру: 224!"
-        else:
-            answer = "К сожалению ваши навыки нам не подходят!"
-        send_mail(
+        if request_doc is None:
+            return False
+        worker = await update_user(user=request_doc[RequestFields.user_id], is_accepted=is_accepted)
+        if worker is None:
+            return False
+        await send_mail(
         to_email=worker.mail,
-        subject="Ответ на заявку",
-        text=answer
+        subject=REQUEST_ANSWER_SUBJECT,
+        text=make_request_answer_text(is_accepted=is_accepted)
     )
     return True
 
 
+async def process_requests(*, items: list[tuple[int, bool]]) -> list[str]:
+    """
+    bulk version of proccess_request for (request_id, is_accepted) items,
+    requests are owned by this call with one update_many first, so users are updated and mails are sent
+    only for requests which are not processed concurrently by other call (they are not_found here),
+    owned requests and their users are read with one $in query each, written with one bulk write each
+    and all mails are stored in outbox with one insert, returns ProcessRequestResults of items
+    """
+    request_ids = list({request_id for request_id, _ in items})
+    processing_by = ObjectId()
+    now = datetime.utcnow()
+    await db.request_collection.update_documents(
+        make_processable_requests_filter(int_ids=request_ids, now=now),
+        set_={
+            RequestFields.processing_by: processing_by,
+            RequestFields.processing_expires_at: now + timedelta(seconds=REQUEST_PROCESSING_LEASE_SECONDS)
+        }
+    )
+    requests = {
+        doc[RequestFields.int_id]: doc
+        async for doc in db.request_collection.create_cursor(
+            filter_=make_processing_requests_filter(processing_by=processing_by),
+            projection=[RequestFields.int_id, RequestFields.user_id]
+        )
+    }
+    user_ids = list({doc[RequestFields.user_id] for doc in requests.values()})
+    users = {
+        doc[UserFields.int_id]: doc
+        async for doc in db.user_collection.create_cursor(
+            filter_=make_users_by_int_ids_filter(int_ids=user_ids),
+            projection=[UserFields.int_id, UserFields.mail]
+        )
+    }
+
+    results = []
+    seen_request_ids = set()
+    user_updates = []
+    updated_user_oids = []
+    processed_request_ids = []
+    messages = []
+    for request_id, is_accepted in items:
+        if request_id in seen_request_ids:
+            results.append(ProcessRequestResults.duplicated)
+            continue
+        seen_request_ids.add(request_id)
+        request_doc = requests.get(request_id)
+        user_doc = users.get(request_doc[RequestFields.user_id]) if request_doc is not None else None
+        if user_doc is None:
+            results.append(ProcessRequestResults.not_found)
+            continue
+        user_updates.append(UpdateOne(
+            {UserFields.int_id: user_doc[UserFields.int_id]},
+            {"$set": {UserFields.is_accepted: is_accepted}}
+        ))
+        updated_user_oids.append(user_doc[UserFields.oid])
+        processed_request_ids.append(request_id)
+        messages.append(MailMessage(
+            to_email=user_doc[UserFields.mail],
+            subject=REQUEST_ANSWER_SUBJECT,
+            text=make_request_answer_text(is_accepted=is_accepted)
+        ))
+        results.append(ProcessRequestResults.accepted if is_accepted else ProcessRequestResults.rejected)
+
+    await db.user_collection.bulk_write(user_updates)
+    invalidate_token_cache(user_oids=updated_user_oids)
+    # owned requests of not existing users are left, they are processable again after lease
+    if processed_request_ids:
+        await db.request_collection.remove_documents(
+            make_processing_requests_filter(processing_by=processing_by, int_ids=processed_request_ids)
+        )
+    await send_mails(messages)
+    return results
+
+
+"""IMPORT CHECKPOINT LOGIC"""
+
+
+def make_import_checkpoint_filter(*, filepath: str, content_hash: str) -> Filter:
+    return {
+        ImportCheckpointFields.filepath: filepath,
+        ImportCheckpointFields.content_hash: content_hash
+    }
+
+
+async def get_or_create_import_checkpoint(*, filepath: str, content_hash: str) -> ImportCheckpoint:
+    filter_ = make_import_checkpoint_filter(filepath=filepath, content_hash=content_hash)
+    doc = await db.import_checkpoint_collection.find_document(filter_=filter_)
+    if doc is None:
+        try:
+            doc = await db.import_checkpoint_collection.insert_document({
+                **filter_,
+                ImportCheckpointFields.last_row: 0,
+                ImportCheckpointFields.is_finished: False,
+                ImportCheckpointFields.updated: datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            doc = await db.import_checkpoint_collection.find_document(filter_=filter_)
+    return ImportCheckpoint.parse_document(doc)
+
+
+async def update_import_checkpoint(
+        *,
+        checkpoint: ImportCheckpoint,
+        last_row: Union[NotSet, int] = NotSet,
+        is_finished: Union[NotSet, bool] = NotSet
+) -> ImportCheckpoint:
+    set_ = {ImportCheckpointFields.updated: datetime.utcnow()}
+    if is_set(last_row):
+        set_[ImportCheckpointFields.last_row] = last_row
+        checkpoint.last_row = last_row
+    if is_set(is_finished):
+        set_[ImportCheckpointFields.is_finished] = is_finished
+        checkpoint.is_finished = is_finished
+    await db.import_checkpoint_collection.update_document_by_id(id_=checkpoint.oid, set_=set_)
+    return checkpoint
+
+
 """MAIL CODE LOGIC"""
 
 
@@ -334,15 +866,12 @@ async def remove_mail_code(
     )
 
 
-def _generate_mail_code() -> str:
-    return str(randint(1, 9)) + str(randint(1, 9)) + str(randint(1, 9)) + str(randint(1, 9))
+MAIL_CODE_INSERT_ATTEMPTS = 10
+MAIL_CODES_SORT: Sort = [(MailCodeFields.created, pymongo.DESCENDING)]
 
 
-async def generate_unique_mail_code() -> str:
-    mail_code = _generate_mail_code()
-    while await db.mail_code_collection.document_exists(filter_={MailCodeFields.code: mail_code}):
-        mail_code = _generate_mail_code()
-    return mail_code
+def _generate_mail_code() -> str:
+    return str(randint(1, 9)) + str(randint(1, 9)) + str(randint(1, 9)) + str(randint(1, 9))
 
 
 async def get_mail_codes(
@@ -367,12 +896,43 @@ async def get_mail_codes(
 
     cursor = db.mail_code_collection.create_cursor(
         filter_=filter_,
-        sort_=[(MailCodeFields.created, pymongo.DESCENDING)],
+        sort_=MAIL_CODES_SORT,
     )
 
     return [MailCode.parse_document(doc) async for doc in cursor]
 
 
+def make_consumable_mail_code_filter(*, to_mail: str, code: str, type_: str, now: datetime) -> Filter:
+    return {
+        MailCodeFields.to_mail: to_mail,
+        MailCodeFields.code: code,
+        MailCodeFields.type: type_,
+        # ttl monitor removes expired codes only once a minute
+        MailCodeFields.created: {
+            "$gt": now - timedelta(seconds=db.mail_code_collection.EXPIRE_AFTER_SECONDS)
+        }
+    }
+
+
+async def consume_mail_code(
+        *,
+        to_mail: str,
+        code: str,
+        type_: str  # use MailCodeTypes
+) -> Optional[MailCode]:
+    """verifies and removes mail code in one atomic operation, returns it with to_user or None if no such code"""
+    doc = await db.mail_code_collection.find_and_remove_document(
+        filter_=make_consumable_mail_code_filter(to_mail=to_mail, code=code, type_=type_, now=datetime.utcnow()),
+        sort_=MAIL_CODES_SORT
+    )
+    if doc is None:
+        return None
+    mail_code = MailCode.parse_document(doc)
+    if mail_code.to_user_oid is not None:
+        mail_code.to_user = await get_user(id_=mail_code.to_user_oid)
+    return mail_code
+
+
 async def create_mail_code(
         *,
         to_mail: str,
@@ -386,16 +946,22 @@ async def create_mail_code(
         if to_user is None:
             raise Exception("to_user is None")
 
-    if code is None:
-        code = await generate_unique_mail_code()
-
-    doc_to_insert = {
-        MailCodeFields.to_mail: to_mail,
-        MailCodeFields.code: code,
-        MailCodeFields.type: type_,
-        MailCodeFields.to_user_oid: to_user_oid
-    }
-    inserted_doc = await db.mail_code_collection.insert_document(doc_to_insert)
+    # codes are unique per to_mail by unique index, so just try to insert random code
+    inserted_doc = None
+    for _ in range(MAIL_CODE_INSERT_ATTEMPTS if code is None else 1):
+        doc_to_insert = {
+            MailCodeFields.to_mail: to_mail,
+            MailCodeFields.code: code if code is not None else _generate_mail_code(),
+            MailCodeFields.type: type_,
+            MailCodeFields.to_user_oid: to_user_oid
+        }
+        try:
+            inserted_doc = await db.mail_code_collection.insert_document(doc_to_insert)
+        except DuplicateKeyError:
+            continue
+        break
+    if inserted_doc is None:
+        raise Exception("cannot insert unique mail code")
     created_mail_code = MailCode.parse_document(inserted_doc)
 
     created_mail_code.to_user = to_user
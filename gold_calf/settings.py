@@ -21,11 +21,25 @@ class Settings(BaseSettings):
     mongo_port: int = 27017
     mongo_auth_db: Optional[str] = None
     mongo_db_name: str = "gold_calf"
+    # count of int_ids reserved by one seq update, per collection and process
+    int_id_block_size: int = 20
+    # db operations slower than this are logged with filter shape, None disables
+    slow_operation_threshold_ms: Optional[float] = 100
 
     mailru_login: str
     mailru_password: str
     mailru_server: str = "smtp.mail.ru"
     mailru_port: int = 465
+    mailru_use_ssl: bool = True
+
+    mail_workers: int = 2
+    mail_batch_size: int = 20
+    mail_max_retries: int = 5
+    mail_retry_backoff: float = 1.0
+    mail_poll_interval: float = 5.0
+    mail_lease_seconds: float = 120.0
+    # outbox depth by status for metrics is counted in mongo every mail_queue_depth_refresh_interval seconds
+    mail_queue_depth_refresh_interval: float = 30
 
     cache_dirname: str = "cache"
     cache_dirpath: str = os.path.join(BASE_DIRPATH, cache_dirname)
@@ -35,6 +49,25 @@ class Settings(BaseSettings):
     mode: str = Modes.dev
 
     emulate_mail_sending: bool = False
+    # debug, documents from db are trusted and not validated by models if False
+    validate_db_documents: bool = False
+
+    token_cache_maxsize: int = 10000
+    token_cache_ttl: float = 60
+
+    # request claimed by reviewer with /request.claim_next returns to pool after this time
+    request_claim_lease_seconds: float = 60 * 15
+
+    # stateless hmac signed tokens instead of session tokens
+    signed_tokens: bool = False
+    signed_tokens_secret: Optional[str] = None
+    signed_tokens_ttl: int = 60 * 60 * 24
+    revocations_refresh_interval: float = 15
+
+    # with several workers each of them writes its metrics to this dir every metrics_write_interval seconds
+    # and /metrics returns sum of them, None means metrics of worker which serves request
+    metrics_dirpath: Optional[str] = None
+    metrics_write_interval: float = 5
 
     @property
     def mongo_uri(self) -> str:
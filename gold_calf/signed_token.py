@@ -0,0 +1,83 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Any, Optional
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(payload: str, secret: str) -> str:
+    return _b64encode(hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest())
+
+
+def is_signed_token(token: str) -> bool:
+    return token.count(".") == 1
+
+
+def sign_token(*, claims: dict[str, Any], secret: str, ttl: float) -> str:
+    """
+    adds jti, iat, exp to claims and returns "<payload>.<signature>" token,
+    payload is urlsafe base64 of json claims
+    """
+    now = time.time()
+    claims = {
+        **claims,
+        "jti": binascii.hexlify(os.urandom(12)).decode(),
+        "iat": now,
+        "exp": now + ttl
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_signature(payload, secret)}"
+
+
+def verify_token(*, token: str, secret: str) -> Optional[dict[str, Any]]:
+    """returns claims if signature is good and token is not expired else None"""
+    if not is_signed_token(token):
+        return None
+    payload, signature = token.split(".")
+    if not hmac.compare_digest(signature, _signature(payload, secret)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or claims.get("exp", 0) <= time.time():
+        return None
+    return claims
+
+
+class RevocationSet:
+    """in-memory view of revoked signed tokens, filled from db by services.refresh_revocations"""
+
+    def __init__(self):
+        self.jtis: set[str] = set()
+        # user oid (str) -> tokens issued before this timestamp are revoked
+        self.users_revoked_before: dict[str, float] = {}
+        self.refreshed_at: Optional[float] = None
+
+    def revoke_jti(self, jti: str):
+        self.jtis.add(jti)
+
+    def revoke_user(self, user_oid: str, revoked_before: float):
+        if revoked_before > self.users_revoked_before.get(user_oid, 0):
+            self.users_revoked_before[user_oid] = revoked_before
+
+    def replace(self, *, jtis: set[str], users_revoked_before: dict[str, float]):
+        self.jtis = jtis
+        self.users_revoked_before = users_revoked_before
+        self.refreshed_at = time.time()
+
+    def is_revoked(self, claims: dict[str, Any]) -> bool:
+        if claims["jti"] in self.jtis:
+            return True
+        return claims["iat"] < self.users_revoked_before.get(claims["oid"], 0)
@@ -0,0 +1,112 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Callable, Iterable
+
+
+class TTLCache:
+    """
+    bounded LRU cache where every entry also expires after ttl seconds,
+    with index_key entries are also indexed by index_key(value) and can be removed by it without scan
+    """
+
+    def __init__(self, *, maxsize: int, ttl: float, index_key: Optional[Callable[[Any], Hashable]] = None):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be > 0")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.index_key = index_key
+        self.__data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        # index_key(value) -> keys
+        self.__index: dict[Hashable, set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+    def __add_to_index(self, key: Hashable, value: Any):
+        if self.index_key is not None:
+            self.__index.setdefault(self.index_key(value), set()).add(key)
+
+    def __remove_from_index(self, key: Hashable, value: Any):
+        if self.index_key is None:
+            return
+        index_value = self.index_key(value)
+        keys = self.__index.get(index_value)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self.__index[index_value]
+
+    def __delete(self, key: Hashable) -> Optional[tuple[float, Any]]:
+        item = self.__data.pop(key, None)
+        if item is not None:
+            self.__remove_from_index(key, item[1])
+        return item
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self.__data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            self.__delete(key)
+            self.misses += 1
+            return None
+        self.__data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        item = self.__data.get(key)
+        if item is not None:
+            self.__remove_from_index(key, item[1])
+            self.__data.move_to_end(key)
+        self.__data[key] = (time.monotonic() + self.ttl, value)
+        self.__add_to_index(key, value)
+        while len(self.__data) > self.maxsize:
+            evicted_key, (_, evicted_value) = self.__data.popitem(last=False)
+            self.__remove_from_index(evicted_key, evicted_value)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        item = self.__delete(key)
+        if item is None:
+            return None
+        return item[1]
+
+    def remove_by_index(self, index_values: Iterable[Hashable]) -> int:
+        """remove all entries where index_key(value) is in index_values, returns count of removed"""
+        if self.index_key is None:
+            raise ValueError("index_key is None")
+        c = 0
+        for index_value in index_values:
+            for key in self.__index.pop(index_value, ()):
+                del self.__data[key]
+                c += 1
+        return c
+
+    def clear(self):
+        self.__data.clear()
+        self.__index.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": len(self.__data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hit_ratio
+        }
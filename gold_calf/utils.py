@@ -1,44 +1,25 @@
 import logging
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 
-from aiogram.utils.markdown import quote_html
-
-from gold_calf.consts import RolesType
-from gold_calf.core import settings
+from gold_calf.core import settings, mail_outbox
+from gold_calf.mail_outbox import MailMessage
 
 log = logging.getLogger(__name__)
 
-def send_mail(to_email: str, subject: str, text: str):
+
+async def send_mail(to_email: str, subject: str, text: str):
+    """stores mail in outbox and returns immediately, mail is sent by outbox workers of any api process"""
     if settings.emulate_mail_sending is True:
         log.info(f'emulating mail sending to {to_email}\n{text}')
         return
 
-    msg = MIMEMultipart()
-    msg['From'] = settings.mailru_login
-    msg['To'] = to_email
-    msg['Subject'] = subject
-
-    body = quote_html(text)
-    msg.attach(MIMEText(body, 'plain'))
-
-    try:
-        server = smtplib.SMTP_SSL(settings.mailru_server, settings.mailru_port)
-        server.login(settings.mailru_login, settings.mailru_password)
-        server.sendmail(settings.mailru_login, to_email, msg.as_string())
-        server.quit()
-    except Exception as e:
-        log.exception(e)
-
-
-def roles_to_list(roles: RolesType) -> list[str]:
-    if isinstance(roles, str):
-        roles = [roles]
-    elif isinstance(roles, set):
-        roles = list(roles)
-    elif isinstance(roles, list):
-        pass
-    else:
-        raise TypeError("bad type for roles")
-    return roles
+    await mail_outbox.put(to_email=to_email, subject=subject, text=text)
+
+
+async def send_mails(messages: list[MailMessage]):
+    """stores all mails in outbox in one insert"""
+    if settings.emulate_mail_sending is True:
+        for message in messages:
+            log.info(f'emulating mail sending to {message.to_email}\n{message.text}')
+        return
+
+    await mail_outbox.put_many(messages)
@@ -0,0 +1,21 @@
+import asyncio
+import sys
+
+from gold_calf.api.events import prepare_db
+from gold_calf.core import db
+from gold_calf.log import setup_logging
+from gold_calf.query_shapes import check_query_shapes
+
+async def main() -> int:
+    setup_logging()
+    await prepare_db()
+    bad_query_shapes = await check_query_shapes(db)
+    if bad_query_shapes:
+        print(f"COLLSCAN, in-memory SORT or not covered in {len(bad_query_shapes)} query shapes: {', '.join(s.name for s in bad_query_shapes)}")
+        return 1
+    print("all query shapes use indexes")
+    return 0
+
+if __name__ == "__main__":
+    loop = asyncio.get_event_loop()
+    sys.exit(loop.run_until_complete(main()))
@@ -0,0 +1,12 @@
+from gold_calf.api.events import prepare_db
+from gold_calf.services import migrate_user_tokens_to_sessions
+
+import asyncio
+
+async def main():
+    await prepare_db()
+    await migrate_user_tokens_to_sessions()
+
+if __name__ == "__main__":
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main())
@@ -1,51 +1,208 @@
+import asyncio
 import csv
+import hashlib
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Iterator, Optional
 
-from gold_calf.api.chema import RequestIn, SensitiveUserOut
+from pydantic import ValidationError
+
+from gold_calf.api.chema import RequestIn
 from gold_calf.db.request import RequestFields
-from gold_calf.services import create_mail_code, get_mail_codes, remove_mail_code, get_user, create_user, get_request, create_request
-from gold_calf.consts import MailCodeTypes
+from gold_calf.services import get_users_by_mails, upsert_users, upsert_requests, make_request_document, \
+    get_or_create_import_checkpoint, update_import_checkpoint
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_CONCURRENCY = 4
+
+# (line number in file, index of row used for mail, csv row)
+RawRow = tuple[int, int, dict[str, str]]
+# (line number in file, error text)
+RowError = tuple[int, str]
+
 
-def parse_users_request(filepath: str) -> list[RequestIn]:
+def validate_rows(rows: list[RawRow]) -> tuple[list[RequestIn], list[RowError]]:
+    """top level to be picklable for process pool"""
+    requests: list[RequestIn] = []
+    errors: list[RowError] = []
+    for line_num, index, row in rows:
+        try:
+            request_dict = {
+                RequestFields.salary: row[RequestFields.salary],
+                RequestFields.remote_radio: row['remote_ratio'],
+                RequestFields.work_year: row[RequestFields.work_year],
+                RequestFields.experience_level: row[RequestFields.experience_level],
+                RequestFields.employment_type: row[RequestFields.employment_type],
+                RequestFields.job_title: row[RequestFields.job_title],
+            }
+            requests.append(RequestIn(mail=f"{index}@uust-astrogame.ru", **request_dict))
+        except (ValidationError, KeyError) as e:
+            errors.append((line_num, str(e).replace("\n", " ")))
+    return requests, errors
+
+
+def iter_raw_rows(filepath: str, batch_size: int, skip_rows: int = 0) -> Iterator[list[RawRow]]:
     with open(filepath, 'r', encoding='utf-8') as file:
         reader = csv.DictReader(file)
-        requests: RequestIn = list()
+        batch: list[RawRow] = []
         index: int = 1
         for row in reader:
-                request_dict = {
-                        RequestFields.salary: row[RequestFields.salary],
-                        RequestFields.remote_radio: row['remote_ratio'],
-                        RequestFields.work_year: row[RequestFields.work_year],
-                        RequestFields.experience_level: row[RequestFields.experience_level],
-                        RequestFields.employment_type: row[RequestFields.employment_type],
-                        RequestFields.job_title: row[RequestFields.job_title],
-                }
-                request_in: RequestIn = RequestIn(mail=f"{index}@uust-astrogame.ru", **request_dict)
-                requests += [request_in]
-                index += 1
-    return requests
-
-async def parse_users(filepath: str):
-    requests: list[RequestIn] = parse_users_request(filepath=filepath)
-    for user in requests:
-        mail_code_reg = await create_mail_code(
-            to_mail=user.mail,
-            type_=MailCodeTypes.reg
+            if index > skip_rows:
+                batch.append((reader.line_num, index, row))
+            index += 1
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _validate_raw_batch(raw_batch: list[RawRow]) -> tuple[int, list[RequestIn], list[RowError]]:
+    return (raw_batch[-1][1], *validate_rows(raw_batch))
+
+
+def iter_request_batches(
+        filepath: str,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        validate_workers: Optional[int] = None,
+        skip_rows: int = 0
+) -> Iterator[tuple[int, list[RequestIn], list[RowError]]]:
+    """
+    yields validated batches as (index of last row, requests, errors of malformed rows),
+    only few batches are in memory,
+    validation is done in process pool with validate_workers processes if it is set
+    """
+    if not validate_workers:
+        for raw_batch in iter_raw_rows(filepath, batch_size, skip_rows):
+            yield _validate_raw_batch(raw_batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=validate_workers) as executor:
+        pending: deque[Future] = deque()
+        for raw_batch in iter_raw_rows(filepath, batch_size, skip_rows):
+            pending.append(executor.submit(_validate_raw_batch, raw_batch))
+            if len(pending) >= validate_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def file_content_hash(filepath: str) -> str:
+    content_hash = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+async def import_requests_batch(requests: list[RequestIn]) -> tuple[int, int]:
+    """
+    idempotently creates missing users and their requests for batch with upserts keyed by mail and user_id,
+    returns count of created users and count of created requests
+    """
+    mails = list(dict.fromkeys(request.mail for request in requests))
+    users_created = await upsert_users(mails=mails)
+    users = await get_users_by_mails(mails=mails)
+
+    docs_to_upsert = {}
+    for request in requests:
+        user_id = users[request.mail].int_id
+        docs_to_upsert[user_id] = make_request_document(user_id=user_id, **request.dict(exclude_unset=True))
+    requests_created = await upsert_requests(documents=list(docs_to_upsert.values()))
+
+    return users_created, requests_created
+
+
+async def parse_users(
+        filepath: str,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        concurrency: int = IMPORT_CONCURRENCY,
+        validate_workers: Optional[int] = None
+):
+    """imports file from last checkpoint, import of already imported file does nothing"""
+    filepath = os.path.abspath(filepath)
+    checkpoint = await get_or_create_import_checkpoint(
+        filepath=filepath,
+        content_hash=await asyncio.to_thread(file_content_hash, filepath)
+    )
+    if checkpoint.is_finished:
+        print("Файл уже импортирован")
+        return
+    if checkpoint.last_row > 0:
+        print(f"Продолжение импорта со строки {checkpoint.last_row + 1}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks: set[asyncio.Task] = set()
+    started = time.monotonic()
+    rows_done, rows_failed, users_created, requests_created = 0, 0, 0, 0
+
+    # batches finish in any order, checkpoint moves only over batches which are all committed
+    dispatched_last_rows: deque[int] = deque()
+    finished_last_rows: set[int] = set()
+    checkpoint_lock = asyncio.Lock()
+
+    async def commit_batch(last_row: int):
+        finished_last_rows.add(last_row)
+        async with checkpoint_lock:
+            committed_row = None
+            while dispatched_last_rows and dispatched_last_rows[0] in finished_last_rows:
+                committed_row = dispatched_last_rows.popleft()
+                finished_last_rows.remove(committed_row)
+            if committed_row is not None:
+                await update_import_checkpoint(checkpoint=checkpoint, last_row=committed_row)
+
+    async def import_batch(last_row: int, batch: list[RequestIn]):
+        nonlocal rows_done, users_created, requests_created
+        try:
+            created = await import_requests_batch(batch)
+        finally:
+            semaphore.release()
+        rows_done += len(batch)
+        users_created += created[0]
+        requests_created += created[1]
+        await commit_batch(last_row)
+        elapsed = time.monotonic() - started
+        print(
+            f"{rows_done} строк, ошибок: {rows_failed}, "
+            f"создано пользователей: {users_created}, заявок: {requests_created}, "
+            f"{rows_done / elapsed:.0f} строк/сек"
         )
-        mail_codes = await get_mail_codes(to_mail=user.mail, code=mail_code_reg.code)
-        mail_code = mail_codes[-1]
-        await remove_mail_code(to_mail=mail_code.to_mail, code=mail_code.code)
-        if await get_user(mail=user.mail) is not None:
-            print("Пользователь уже существует")
-            user_created = await get_user(mail=user.mail)
-        else:
-            print("Пользователь создан")
-            user_created = await create_user(mail=user.mail, auto_create_at_least_one_token=True)
-        if await get_request(user_id=user_created.int_id) is not None:
-            print("Вы уже посылали")
-        else:
-            print("Заявка отправлена")
-            create_request_data = user.dict(exclude_unset=True)
-            request = await create_request(
-            user_id=user_created.int_id,
-            **create_request_data
-            )
\ No newline at end of file
+
+    # file is read and validated in thread while previous batches are written to db
+    batches = iter_request_batches(
+        filepath, batch_size=batch_size, validate_workers=validate_workers, skip_rows=checkpoint.last_row
+    )
+    import_errors: list[BaseException] = []
+
+    def on_import_batch_done(task: asyncio.Task):
+        tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            import_errors.append(task.exception())
+
+    while not import_errors:
+        await semaphore.acquire()
+        item = await asyncio.to_thread(next, batches, None)
+        if item is None:
+            semaphore.release()
+            break
+        last_row, batch, errors = item
+        for line_num, error in errors:
+            print(f"Строка {line_num} пропущена: {error}")
+        rows_failed += len(errors)
+        dispatched_last_rows.append(last_row)
+        if not batch:
+            semaphore.release()
+            await commit_batch(last_row)
+            continue
+        task = asyncio.create_task(import_batch(last_row, batch))
+        tasks.add(task)
+        task.add_done_callback(on_import_batch_done)
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if import_errors:
+        # checkpoint stays before failed batch, next run continues from it
+        raise import_errors[0]
+
+    await update_import_checkpoint(checkpoint=checkpoint, is_finished=True)